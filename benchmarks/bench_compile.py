@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+""" Compares the time to render a template when it has to be compiled from
+scratch, when the compiled code comes from the on-disk bytecode cache (as in a
+later run) and when a Renderer already holds it in memory (as in batch and
+watch modes).
+
+    python benchmarks/bench_compile.py
+"""
+import pathlib
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from markplates import Renderer  # noqa: E402
+
+
+def write_template(directory, sections):
+    """ A template with prose and a set_path directive in every section. """
+    template = pathlib.Path(directory) / "article.mdt"
+    with open(template, "w") as f:
+        f.write("# Benchmark\n\n")
+        for n in range(sections):
+            f.write(f"## Section {n}\n\nSome text about section {n}.\n")
+            f.write('{{ set_path("%s") }}\n' % directory)
+            f.write("{{ '%d' }}\n\n" % n)
+    return template
+
+
+def best_of(stmt, repeat=5):
+    timer = timeit.Timer(stmt)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def main():
+    print(f"{'sections':>9} {'cold':>10} {'bytecode':>10} {'warm':>10}")
+    for sections in [10, 100, 1000]:
+        with tempfile.TemporaryDirectory() as directory:
+            template = write_template(directory, sections)
+            cache_dir = pathlib.Path(directory, "bytecode")
+            Renderer(bytecode_cache_dir=cache_dir).render(template)
+            warm = Renderer()
+            warm.render(template)
+
+            cold_time = best_of(lambda: Renderer().render(template))
+            bytecode_time = best_of(
+                lambda: Renderer(bytecode_cache_dir=cache_dir).render(template)
+            )
+            warm_time = best_of(lambda: warm.render(template))
+        print(
+            f"{sections:>9} {cold_time * 1e3:>8.2f}ms "
+            f"{bytecode_time * 1e3:>8.2f}ms {warm_time * 1e3:>8.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+""" Shows how condense_ranges scales with the size of the file and the number
+of ranges requested. The set based algorithm it replaced is timed alongside
+for comparison.
+
+    python benchmarks/bench_ranges.py
+"""
+
+import pathlib
+import sys
+import timeit
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from markplates import condense_ranges  # noqa: E402
+
+
+def set_based(input_lines, ranges):
+    """ The original algorithm, without the error handling. """
+    output_numbers = set()
+    for _range in ranges:
+        try:
+            output_numbers.add(int(_range))
+        except ValueError:
+            start, end = _range.split("-")
+            if start == "$":
+                # $-N is the last N lines and one more, as condense_ranges
+                # had it
+                count = int(end)
+                end = len(input_lines)
+                start = end - count
+            else:
+                end = len(input_lines) if end.strip() == "$" else int(end)
+            output_numbers.update(range(int(start), end + 1))
+    return [input_lines[number - 1] for number in sorted(output_numbers)]
+
+
+def spread_ranges(line_count, range_count):
+    """ range_count ranges of ten lines spread evenly through the file. """
+    step = max(line_count // range_count, 10)
+    return [f"{start}-{start + 9}" for start in range(1, line_count - 9, step)][
+        :range_count
+    ]
+
+
+def best_of(stmt, repeat=5):
+    timer = timeit.Timer(stmt)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def main():
+    print(
+        f"{'lines':>8} {'ranges':>8} {'case':>8} {'intervals':>12} {'sets':>12}"
+    )
+    for line_count in [1_000, 10_000, 100_000, 500_000]:
+        lines = [f"{n}\n" for n in range(1, line_count + 1)]
+        cases = [("all", ["1-$"]), ("tail", ["$-20"])]
+        for range_count in [1, 10, 100, 1000]:
+            ranges = spread_ranges(line_count, range_count)
+            # small files can't fit more ranges, so skip the repeats
+            if ranges != cases[-1][1]:
+                cases.append(("spread", ranges))
+        for name, ranges in cases:
+            new = best_of(lambda: condense_ranges(lines, ranges, "bench"))
+            old = best_of(lambda: set_based(lines, ranges))
+            print(
+                f"{line_count:>8} {len(ranges):>8} {name:>8} "
+                f"{new * 1e6:>10.1f}us {old * 1e6:>10.1f}us"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+""" Measures how long markplates takes to import, using python -X importtime,
+and lists the modules that cost the most.
+
+    python benchmarks/bench_startup.py [--runs N] [--max-ms MS]
+
+With --max-ms it exits non-zero if importing markplates takes longer than
+that, so it can be used to catch startup regressions.
+"""
+import argparse
+import pathlib
+import statistics
+import subprocess
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    "import markplates": "import markplates",
+    "command line": "import markplates.__main__",
+    "render": "import markplates.__main__, markplates.environment",
+}
+
+
+def import_times(statement):
+    """ List of (module, cumulative microseconds, top level) for each import
+    statement runs.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # nested imports are indented under the one that caused them
+        top_level = not name[1:].startswith(" ")
+        times.append((name.strip(), int(cumulative), top_level))
+    return times
+
+
+def total(times):
+    """ Time spent in top level imports, which include everything else. """
+    return sum(cumulative for _, cumulative, top_level in times if top_level)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float)
+    args = parser.parse_args()
+
+    baseline = statistics.median(
+        total(import_times("pass")) for _ in range(args.runs)
+    )
+    results = {}
+    for label, statement in SCENARIOS.items():
+        runs = [import_times(statement) for _ in range(args.runs)]
+        elapsed = statistics.median(total(r) for r in runs) - baseline
+        results[label] = elapsed
+        print(f"{label:<20} {elapsed / 1000:8.1f}ms")
+        slowest = sorted(runs[-1], key=lambda item: -item[1])
+        for name, cumulative, _ in slowest[:5]:
+            print(f"    {name:<30} {cumulative / 1000:8.1f}ms")
+
+    if args.max_ms is not None:
+        elapsed = results["import markplates"] / 1000
+        if elapsed > args.max_ms:
+            print(f"import markplates took {elapsed:.1f}ms > {args.max_ms}ms")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+""" Compares two result files written by benchmarks/suite.py.
+
+    python benchmarks/compare.py before.json after.json [--threshold 1.1]
+
+Prints the change for every benchmark in both files and exits non-zero if any
+of them got slower by more than the threshold ratio.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.1,
+        help="Slowdown ratio counted as a regression",
+    )
+    args = parser.parse_args()
+
+    before = load(args.before)
+    after = load(args.after)
+    print(
+        f"before: {before['meta'].get('commit')}  "
+        f"after: {after['meta'].get('commit')}"
+    )
+
+    regressions = []
+    for name in sorted(set(before["results"]) | set(after["results"])):
+        if name not in before["results"] or name not in after["results"]:
+            which = "before" if name in before["results"] else "after"
+            print(f"{name:<45} only in {which}")
+            continue
+        old = before["results"][name]["seconds"]
+        new = after["results"][name]["seconds"]
+        ratio = new / old if old else float("inf")
+        flag = ""
+        if ratio > args.threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(
+            f"{name:<45} {old * 1e3:>10.3f}ms {new * 1e3:>10.3f}ms "
+            f"{ratio:>6.2f}x{flag}"
+        )
+
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than {args.threshold}x")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
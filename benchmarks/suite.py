@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+""" Benchmarks for each stage of the rendering pipeline, run against
+synthetic workloads that can be scaled up.
+
+    python benchmarks/suite.py [--quick] [--filter NAME] [-o results.json]
+
+Every benchmark is timed separately and the best of several repeats is kept.
+The results are written as JSON so that two runs, say before and after a
+change, can be compared with benchmarks/compare.py.
+"""
+
+import argparse
+import datetime
+import json
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+import timeit
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import markplates.__main__ as core  # noqa: E402
+
+
+def make_source(directory, lines):
+    """ A python file of roughly lines lines: functions of ten lines each,
+    separated by double blank lines like black leaves them.
+    """
+    path = pathlib.Path(directory) / f"source_{lines}.py"
+    with open(path, "w") as f:
+        f.write("#!/usr/bin/env python\n")
+        for n in range(lines // 10):
+            f.write(f"def function_{n}(a, b):\n")
+            f.write(f'    """ Function number {n}. """\n')
+            for step in range(5):
+                f.write(f"    a = a * {step} + b\n")
+            f.write("    return a\n\n\n")
+    return path
+
+
+def make_nested_source(directory, depth, width):
+    """ Classes nested depth deep, each level holding width methods. Returns
+    the path and the dotted name of the deepest method.
+    """
+    path = pathlib.Path(directory) / f"nested_{depth}_{width}.py"
+    names = []
+    with open(path, "w") as f:
+        for level in range(depth):
+            indent = "    " * level
+            f.write(f"{indent}class Level{level}:\n")
+            names.append(f"Level{level}")
+            for n in range(width):
+                f.write(f"{indent}    def method_{n}(self):\n")
+                f.write(f"{indent}        return {n}\n\n")
+    return path, ".".join(names + [f"method_{width - 1}"])
+
+
+def make_template(directory, source, directives):
+    """ A template calling import_source and import_function directives times
+    in total, with prose between each call.
+    """
+    path = pathlib.Path(directory) / f"template_{directives}.mdt"
+    with open(path, "w") as f:
+        f.write("# Benchmark\n\n")
+        f.write('{{ set_path("%s") }}\n' % pathlib.Path(directory).as_posix())
+        for n in range(directives):
+            f.write(f"Paragraph {n} of the article.\n")
+            if n % 2:
+                start = (n * 10) % 9000 + 2
+                f.write(
+                    '{{ import_source("%s", ["%d-%d"], "python") }}\n\n'
+                    % (source.name, start, start + 8)
+                )
+            else:
+                f.write(
+                    '{{ import_function("%s", "function_%d") }}\n\n'
+                    % (source.name, n % 900)
+                )
+    return path
+
+
+def make_repl_template(directory, blocks):
+    path = pathlib.Path(directory) / f"repl_{blocks}.mdt"
+    with open(path, "w") as f:
+        for n in range(blocks):
+            f.write('{{ import_repl("""\nx = %d\nprint(x * 2)\n""") }}\n' % n)
+    return path
+
+
+def best_of(stmt, repeat):
+    timer = timeit.Timer(stmt)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+class Suite:
+    def __init__(self, directory, quick, name_filter, repeat):
+        self.directory = directory
+        self.quick = quick
+        self.filter = name_filter
+        self.repeat = repeat
+        self.results = {}
+
+    def sizes(self, full, quick):
+        return quick if self.quick else full
+
+    def time(self, name, stmt, **params):
+        if self.filter and self.filter not in name:
+            return
+        seconds = best_of(stmt, self.repeat)
+        self.results[name] = {"seconds": seconds, "params": params}
+        print(f"{name:<45} {seconds * 1e3:>12.3f}ms", flush=True)
+
+    def run(self):
+        sources = {}
+        for lines in self.sizes([10_000, 100_000, 1_000_000], [10_000]):
+            sources[lines] = make_source(self.directory, lines)
+            with open(sources[lines]) as f:
+                text_lines = f.readlines()
+            self.bench_lines(lines, text_lines)
+            self.bench_snippet(lines, sources[lines])
+            self.bench_find(lines, sources[lines])
+
+        self.bench_nested()
+
+        source = sources[10_000]
+        for directives in self.sizes([100, 1000, 5000], [100]):
+            template = make_template(self.directory, source, directives)
+            self.time(
+                f"process_template/directives={directives}",
+                lambda: core.process_template(template, False),
+                directives=directives,
+            )
+            renderer = core.Renderer()
+            self.time(
+                f"renderer_warm/directives={directives}",
+                lambda: renderer.render(template),
+                directives=directives,
+            )
+
+        for blocks in self.sizes([10, 100], [10]):
+            template = make_repl_template(self.directory, blocks)
+            self.time(
+                f"import_repl/blocks={blocks}",
+                lambda: core.process_template(template, False),
+                blocks=blocks,
+            )
+        return self.results
+
+    def bench_lines(self, lines, text_lines):
+        self.time(
+            f"condense_ranges/all/lines={lines}",
+            lambda: core.condense_ranges(text_lines, ["1-$"], "bench"),
+            lines=lines,
+        )
+        for count in self.sizes([10, 1000], [10]):
+            step = max(len(text_lines) // count, 1)
+            ranges = [
+                f"{n}-{n + 5}" for n in range(1, len(text_lines) - 5, step)
+            ][:count]
+            self.time(
+                f"condense_ranges/ranges={count}/lines={lines}",
+                lambda: core.condense_ranges(text_lines, ranges, "bench"),
+                lines=lines,
+                ranges=count,
+            )
+        self.time(
+            f"remove_double_blanks/lines={lines}",
+            lambda: core.remove_double_blanks(text_lines),
+            lines=lines,
+        )
+        indented = ["    " + line for line in text_lines]
+        self.time(
+            f"left_justify/lines={lines}",
+            lambda: core.left_justify(indented),
+            lines=lines,
+        )
+
+    def bench_snippet(self, lines, source):
+        state = core.TemplateState()
+        state.set_path(self.directory)
+        self.time(
+            f"import_source/all/lines={lines}",
+            lambda: state._import_source(
+                source, source.name, ["1-$"], "python", True, False
+            ),
+            lines=lines,
+        )
+
+    def bench_find(self, lines, source):
+        name = f"function_{lines // 20}"
+        self.time(
+            f"find_in_source/cold/lines={lines}",
+            lambda: core.find_in_source(source, name),
+            lines=lines,
+        )
+        self.time(
+            f"find_in_source/fast/lines={lines}",
+            lambda: core.find_in_source(source, name, fast=True),
+            lines=lines,
+        )
+        cache = core.SourceCache()
+        core.find_in_source(source, name, cache)
+        self.time(
+            f"find_in_source/warm/lines={lines}",
+            lambda: core.find_in_source(source, name, cache),
+            lines=lines,
+        )
+
+    def bench_nested(self):
+        for depth in self.sizes([5, 20, 50], [5]):
+            source, name = make_nested_source(self.directory, depth, 50)
+            self.time(
+                f"find_in_source/nested/depth={depth}",
+                lambda: core.find_in_source(source, name),
+                depth=depth,
+                width=50,
+            )
+
+
+def metadata():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+        commit = commit.stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--quick", action="store_true", help="Only the smallest workloads"
+    )
+    parser.add_argument(
+        "--filter", help="Only run benchmarks whose name contains this"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "-o", "--output", help="Write the results to this JSON file"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        suite = Suite(directory, args.quick, args.filter, args.repeat)
+        results = suite.run()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"meta": metadata(), "results": results},
+                f,
+                indent=1,
+                sort_keys=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import os
+import pathlib
 import pytest
 
 # Adding this file helps pytest work out path to simplify testing!
@@ -9,3 +11,31 @@ def counting_lines():
     def _gen_lines(limit=13):
         return [str(x + 1) + "\n" for x in range(limit)]
     return _gen_lines
+
+
+@pytest.fixture
+def bump():
+    """ Rewrite a file, making sure its mtime moves on. """
+    def _bump(path, text):
+        old = path.stat().st_mtime_ns
+        path.write_text(text)
+        os.utime(path, ns=(old + 10 ** 9, old + 10 ** 9))
+    return _bump
+
+
+@pytest.fixture
+def make_article(tmp_path):
+    """ Writes a template, by default into tmp_path, along with any of the
+    source files it imports which don't exist yet, and returns its path.
+    "{path}" in the text is replaced with the directory, for set_path().
+    """
+    def _make_article(text, name="article.mdt", sources=None, directory=None):
+        directory = tmp_path if directory is None else pathlib.Path(directory)
+        for source_name, source_text in (sources or {}).items():
+            source = directory / source_name
+            if not source.exists():
+                source.write_text(source_text)
+        template = directory / name
+        template.write_text(text.replace("{path}", str(directory)))
+        return template
+    return _make_article
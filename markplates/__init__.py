@@ -1,5 +1,24 @@
-from .__main__ import condense_ranges
-from .__main__ import process_template
-from .__main__ import main
+import importlib
 
 __version__ = "1.7.0"
+
+# These are imported from __main__ on first use, so that "import markplates"
+# doesn't pay for click, jinja2 and friends until they are needed.
+_exports = {
+    "condense_ranges": "__main__",
+    "process_template": "__main__",
+    "SourceCache": "__main__",
+    "Renderer": "__main__",
+    "main": "__main__",
+}
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f".{_exports[name]}", __name__)
+    return getattr(module, name)
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_exports))
@@ -1,67 +1,389 @@
 #!/usr/bin/env python3
-import ast
-import asttokens
 import click
-import code
-import contextlib
+import contextvars
 import errno
+import functools
+import hashlib
 import io
-import jinja2
+import itertools
 import os
 import pathlib
 import re
+import shutil
 import sys
-import pyperclip
+import threading
+import uuid
 
-# Global set from command line options. Don't know of a good way to pass options
-# through jinja2 to the functions being called from the template
-g_indicate_skipped_lines = False
+from .profile import count as _count_for_profile
 
 
-def _descend_tree(atok, parent, local_name, name_parts):
+def _index_symbols(parsed, parent, prefix, index):
+    """ Records the source span of every function, class and assignment below
+    parent, keyed on its dotted name. When a name is used more than once the
+    first one wins, and only the first function or class of a given name is
+    searched for children.
+    """
+    import ast
+
+    containers = set()
     for node in ast.iter_child_nodes(parent):
-        if (
-            node.__class__ in [ast.FunctionDef, ast.ClassDef]
-            and node.name == local_name
-        ):
-            if len(name_parts) == 0:
-                # Found the node, return the code
-                return atok.get_text(node) + "\n"
+        if node.__class__ in [ast.FunctionDef, ast.ClassDef]:
+            qualified_name = prefix + node.name
+            if qualified_name not in index:
+                index[qualified_name] = parsed.span(node)
+            if node.name not in containers:
+                containers.add(node.name)
+                _index_symbols(parsed, node, qualified_name + ".", index)
+        elif node.__class__ == ast.Assign:
+            qualified_name = prefix + parsed.first_token(node)
+            if qualified_name not in index:
+                index[qualified_name] = parsed.span(node)
 
-            # Found a fn or class, but looking for a child of it
-            return _descend_tree(atok, node, name_parts[0], name_parts[1:])
 
-        if (
-            node.__class__ == ast.Assign
-            and node.first_token.string == local_name
-            and len(name_parts) == 0
-        ):
-            return atok.get_text(node) + "\n"
+class ParsedSource:
+    """ A parsed source file along with an index of the symbols it defines.
+    The text of each symbol is found from the positions recorded in the tree;
+    asttokens is only used for the odd node where those aren't enough, or on
+    Pythons which don't record end positions.
+    """
 
-    return ""
+    def __init__(self, text, tree):
+        from . import spans
 
+        self.text = text
+        self.tree = tree
+        self._symbols = None
+        self._atok = None
+        self._spans = spans.SourceSpans(text) if spans.SUPPORTED else None
 
-def find_in_source(source, name):
-    with open(source) as f:
-        source_text = f.read()
+    @property
+    def atok(self):
+        """ The asttokens view of the source, made on first use. """
+        if self._atok is None:
+            import asttokens
 
-    try:
-        atok = asttokens.ASTTokens(source_text, parse=True)
-    except SyntaxError as synErr:
-        print(f"Failed to parse {source}: {synErr}")
-        sys.exit(1)
+            self._atok = asttokens.ASTTokens(self.text, tree=self.tree)
+        return self._atok
+
+    def span(self, node):
+        """ The (start, end) offsets of node in the text. """
+        from .spans import Unsupported
 
-    name_parts = name.split(".")
-    return _descend_tree(atok, atok.tree, name_parts[0], name_parts[1:])
+        if self._spans is not None:
+            try:
+                return self._spans.span(node)
+            except Unsupported:
+                pass
+        return self.atok.get_text_range(node)
 
+    def first_token(self, node):
+        """ The text of the first token of node. """
+        from .spans import Unsupported
+
+        if self._spans is not None:
+            try:
+                return self._spans.first_token(node)
+            except Unsupported:
+                pass
+        # making the asttokens view marks the tokens of every node
+        self.atok
+        return node.first_token.string
+
+    @property
+    def symbols(self):
+        """ Maps each qualified name, such as "Square.area", to the (start,
+        end) offsets of its code in the source text. Built on first use.
+        """
+        if self._symbols is None:
+            self._symbols = {}
+            _index_symbols(self, self.tree, "", self._symbols)
+        return self._symbols
+
+    def get_text(self, name):
+        """ Return the code for name or an empty string if it isn't found. """
+        span = self.symbols.get(name)
+        if span is None:
+            return ""
+        start, end = span
+        return self.text[start:end] + "\n"
+
+
+class SourceCache:
+    """ Caches parsed source files for the duration of a render so that
+    several import_function calls on the same file only tokenize it once, and
+    the lines of files read by import_source. Entries are keyed on the resolved
+    path and invalidated if the file's mtime or size changes. The hits and
+    misses counters show how well it is doing, and bytes_read how much of the
+    disk it has had to read. It can be shared between threads; a file being
+    loaded by one thread is waited for, rather than loaded again, by others.
+    """
+
+    # files bigger than this are indexed rather than read into memory
+    large_file_size = 16 * 1024 * 1024
 
-class TemplateState:
     def __init__(self):
+        self._entries = {}
+        self._lines = {}
+        self._digests = {}
+        self._found = {}
+        self._lock = threading.Lock()
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+
+    def __getstate__(self):
+        # copies sent to other processes start out empty
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def _key(self, source):
+        path = pathlib.Path(source).resolve()
+        stat = path.stat()
+        return path, (stat.st_mtime_ns, stat.st_size)
+
+    def _lookup(self, table, path, signature):
+        """ The cached value, counting the hit, or None. Call with the lock
+        held.
+        """
+        entry = table.get(path)
+        if entry is not None and entry[0] == signature:
+            self.hits += 1
+            _count_for_profile(cache_hits=1)
+            return entry[1]
+        return None
+
+    def _get(self, table, source, load):
+        """ Return the entry for source in table, calling load(path,
+        signature) to create it if needed.
+        """
+        path, signature = self._key(source)
+        with self._lock:
+            value = self._lookup(table, path, signature)
+            if value is not None:
+                return value
+            loading = self._loading.setdefault(
+                (id(table), path), threading.Lock()
+            )
+
+        with loading:
+            # another thread may have loaded it while this one waited
+            with self._lock:
+                value = self._lookup(table, path, signature)
+                if value is not None:
+                    return value
+                self.misses += 1
+            value = load(path, signature)
+            with self._lock:
+                self.bytes_read += signature[1]
+                table[path] = (signature, value)
+            _count_for_profile(bytes_read=signature[1])
+            return value
+
+    def _parse(self, path, signature):
+        with open(path) as f:
+            source_text = f.read()
+
+        import ast
+
+        return ParsedSource(source_text, ast.parse(source_text))
+
+    def parse(self, source):
+        """ Return the ParsedSource for source, parsing it only if needed. """
+        try:
+            return self._get(self._entries, source, self._parse)
+        except SyntaxError as synErr:
+            print(f"Failed to parse {source}: {synErr}")
+            sys.exit(1)
+
+    def _read_lines(self, path, signature):
+        if signature[1] > self.large_file_size:
+            from .lines import LineIndex
+
+            return LineIndex(path)
+        with open(path, "r") as f:
+            return f.readlines()
+
+    def read_lines(self, source):
+        """ Return the lines of source, reading the file only if needed. The
+        list is shared, so callers must not modify it. Files bigger than
+        large_file_size are not read at all; a LineIndex is returned instead,
+        which reads only the lines that are asked for.
+        """
+        return self._get(self._lines, source, self._read_lines)
+
+    def _digest(self, path, signature):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def digest(self, source):
+        """ sha256 of the contents of source, as a hex string. """
+        path, signature = self._key(source)
+        with self._lock:
+            entry = self._digests.get(path)
+            if entry is not None and entry[0] == signature:
+                return entry[1]
+        digest = self._digest(path, signature)
+        with self._lock:
+            self.bytes_read += signature[1]
+            self._digests[path] = (signature, digest)
+        _count_for_profile(bytes_read=signature[1])
+        return digest
+
+    def find(self, source, name):
+        """ The code for name, found by tokenizing source only as far as the
+        end of it, or None if the whole file has to be parsed to tell. Only
+        the code found is kept, not the file.
+        """
+        from . import quickfind
+
+        path, signature = self._key(source)
+        with self._lock:
+            entry = self._found.get(path)
+            if entry is not None and entry[0] == signature:
+                if name in entry[1]:
+                    self.hits += 1
+                    _count_for_profile(cache_hits=1)
+                    return entry[1][name]
+            self.misses += 1
+
+        read = 0
+        with open(path) as f:
+
+            def readline():
+                nonlocal read
+                line = f.readline()
+                read += len(line)
+                return line
+
+            try:
+                code = quickfind.find(readline, name)
+            except quickfind.Undecided:
+                code = None
+        _count_for_profile(bytes_read=read)
+        with self._lock:
+            self.bytes_read += read
+            entry = self._found.get(path)
+            if entry is None or entry[0] != signature:
+                entry = self._found[path] = (signature, {})
+            entry[1][name] = code
+        return code
+
+    def is_loaded(self, source, parse=False):
+        """ True if source is already in the cache, parsed if parse is set,
+        and the file hasn't changed since.
+        """
+        try:
+            path, signature = self._key(source)
+        except OSError:
+            return False
+        table = self._entries if parse else self._lines
+        with self._lock:
+            entry = table.get(path)
+        return entry is not None and entry[0] == signature
+
+    def preload(self, source, parse=False):
+        """ Read source, and parse it too if asked, so that later calls find
+        it in the cache. Errors are ignored here; they are reported when the
+        file is actually used.
+        """
+        try:
+            if parse:
+                self._get(self._entries, source, self._parse)
+            else:
+                self._get(self._lines, source, self._read_lines)
+        except Exception:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._lines.clear()
+            self._digests.clear()
+            self._found.clear()
+            self.hits = 0
+            self.misses = 0
+            self.bytes_read = 0
+
+
+def find_in_source(source, name, cache=None, fast=False):
+    """ Return the code for name in source, or an empty string if it isn't
+    there. With fast, a file that isn't already parsed in the cache is only
+    tokenized as far as the end of name, falling back to parsing all of it
+    when that isn't enough.
+    """
+    if cache is None:
+        cache = SourceCache()
+    if fast and not cache.is_loaded(source, parse=True):
+        code = cache.find(source, name)
+        if code is not None:
+            return code
+    return cache.parse(source).get_text(name)
+
+
+def find_all_in_source(source, names, cache=None):
+    """ The code for each of names, in the same order, from a single parse of
+    source. As with find_in_source(), a name that isn't found gives an empty
+    string.
+    """
+    if cache is None:
+        cache = SourceCache()
+    parsed = cache.parse(source)
+    return [parsed.get_text(name) for name in names]
+
+
+class TemplateState:
+    """ Everything belonging to a single render: the settings made by
+    set_path() and the files read. Its methods are the functions templates
+    call. The caches it is given may be shared with other renders, in this
+    thread or others.
+    """
+
+    def __init__(self, source_cache=None, fragment_cache=None, repl_pool=None):
         self.path = pathlib.Path(".")
+        self.show_skipped = False
+        if source_cache is None:
+            source_cache = SourceCache()
+        self.source_cache = source_cache
+        self.fragment_cache = fragment_cache
+        self.pending_repl = None
+        self.repl_sessions = {}
+        if repl_pool is not None:
+            from .repl import PendingBlocks
+
+            self.pending_repl = PendingBlocks(repl_pool)
+        # every file read while rendering, used to decide when to re-render
+        self.dependencies = set()
+
+    def _add_dependency(self, source_name):
+        self.dependencies.add(str(pathlib.Path(source_name).resolve()))
+
+    def _cached(self, render, key_parts, source_name=None):
+        """ Return render(), or the result of an earlier call with the same
+        key_parts from the fragment cache. The contents of source_name are
+        part of the key when it is given.
+        """
+        if self.fragment_cache is None:
+            return render()
+
+        if source_name is not None:
+            key_parts += (self.source_cache.digest(source_name),)
+        key = self.fragment_cache.key(*key_parts)
+        text = self.fragment_cache.get(key)
+        if text is None:
+            text = render()
+            self.fragment_cache.put(key, text)
+        else:
+            _count_for_profile(cache_hits=1)
+        return text
 
     def set_path(self, path, show_skipped=False):
-        global g_indicate_skipped_lines
-        g_indicate_skipped_lines = show_skipped
+        self.show_skipped = show_skipped
         self.path = pathlib.Path(path)
         if not self.path.is_dir():
             raise FileNotFoundError(
@@ -69,107 +391,320 @@ class TemplateState:
             )
         return ""
 
-    def _add_filename(self, to_add, source, lines):
-        if to_add:
-            lines.insert(0, "# %s\n" % source)
-
-    def _add_language(self, language, lines):
-        if language:
-            if language.lower() in ["c", "cpp", "c++"]:
-                language = "cpp"
-            lines.insert(0, "```%s\n" % language.lower())
-            lines.append("```")
-
-    def _strip_trailing_blanks(self, lines):
-        if lines:
-            while re.search(r"^ *$", lines[-1]):
-                del lines[-1]
-
     def import_source(self, source, ranges=None, language=None, filename=False):
         source_name = self.path / source
-        lines = open(source_name, "r").readlines()
+        show_skipped = self.show_skipped
+        self._add_dependency(source_name)
+        return self._cached(
+            lambda: self._import_source(
+                source_name, source, ranges, language, filename, show_skipped
+            ),
+            self._source_key(
+                source, ranges, language, filename, show_skipped=show_skipped
+            ),
+            source_name,
+        )
+
+    def _source_key(
+        self,
+        source,
+        ranges=None,
+        language=None,
+        filename=False,
+        *,
+        show_skipped=False,
+    ):
+        return (
+            "import_source",
+            source,
+            ranges,
+            language,
+            filename,
+            show_skipped,
+        )
+
+    def _import_source(
+        self, source_name, source, ranges, language, filename, show_skipped
+    ):
+        lines = self.source_cache.read_lines(source_name)
         if not ranges:
             ranges = ["2-$"]
 
-        lines = condense_ranges(lines, ranges, source_name)
-        lines = remove_double_blanks(lines)
+        lines = _iter_ranges(
+            lines, _resolve_ranges(lines, ranges, source_name), show_skipped
+        )
+        lines, lead = _collapse_blanks(lines)
         # If the trailing line doesn't have a \n, add one here
         if lines and not lines[-1].endswith("\n"):
             lines[-1] += "\n"
-        self._strip_trailing_blanks(lines)
-        lines = left_justify(lines)
-        self._add_filename(filename, source, lines)
-        self._add_language(language, lines)
-        return "".join(lines).rstrip()
+        return format_snippet(lines, source, language, filename, lead or 0)
 
     def import_function(
-        self, source, function_name, language=None, filename=False
+        self, source, function_name, language=None, filename=False, fast=False
     ):
-        """ Search for and extract a function."""
+        """ Search for and extract a function. With fast, the file is only
+        tokenized up to the end of the function rather than parsed in full.
+        """
         source_name = self.path / source
-        code = find_in_source(source_name, function_name)
+        self._add_dependency(source_name)
+        return self._cached(
+            lambda: self._import_function(
+                source_name, source, function_name, language, filename, fast
+            ),
+            self._function_key(source, function_name, language, filename),
+            source_name,
+        )
+
+    def _function_key(
+        self, source, function_name, language=None, filename=False, fast=False
+    ):
+        # fast finds the same code, so it isn't part of the key
+        return ("import_function", source, function_name, language, filename)
+
+    def _import_function(
+        self, source_name, source, function_name, language, filename, fast
+    ):
+        code = find_in_source(
+            source_name, function_name, self.source_cache, fast
+        )
+        return self._format_function(
+            code, source, function_name, language, filename
+        )
+
+    def _format_function(self, code, source, function_name, language, filename):
         if not code:
             raise Exception(f"Function not found: {function_name}")
 
-        output_lines = code.splitlines(keepends=True)
-        self._strip_trailing_blanks(output_lines)
-        output_lines = left_justify(output_lines)
-        self._add_filename(filename, source, output_lines)
-        self._add_language(language, output_lines)
-        return "".join(output_lines).rstrip()
-
-    def import_repl(self, source):
-        # split into individual lines
-        lines = source.split("\n")
-        # it's a bit cleaner to start the first line of code on the line after
-        # the start of the string, so remove a single blank line from the start
-        # if it's present
-        if len(lines[0]) == 0:
-            lines.pop(0)
-
-        # set up the console and prompts
-        console = code.InteractiveConsole()
-        ps1 = ">>> "
-        prompt = ps1
-
-        with io.StringIO() as output:
-            with contextlib.redirect_stdout(output):
-                with contextlib.redirect_stderr(output):
-                    ps2 = "... "
-                    for line in lines:
-                        # don't show prompt on blank lines - spacing looks
-                        # better this way
-                        if len(line) != 0:
-                            print(f"{prompt}{line}")
-                        else:
-                            print()
-                        console.push(line)
-                        if line.endswith(":"):
-                            prompt = ps2
-                        elif len(line) == 0:
-                            prompt = ps1
-            # Trim trailing blank lines
-            outputString = output.getvalue()
-            while outputString[-1] == "\n":
-                outputString = outputString[:-1]
-                # degenerate case of entirely empty repl block
-                # still return a single blank line
-                if len(outputString) < 2:
-                    return outputString
-            return outputString
+        lines = code.splitlines(keepends=True)
+        return format_snippet(lines, source, language, filename)
+
+    def import_functions(
+        self,
+        source,
+        function_names,
+        language=None,
+        filename=False,
+        separator="\n\n",
+    ):
+        """ Extract several functions from one file, each as import_function()
+        would, parsing the file only once. The snippets are joined with
+        separator, or returned as a list when it is None.
+        """
+        if isinstance(function_names, str):
+            raise TypeError("import_functions() takes a list of names")
+        source_name = self.path / source
+        self._add_dependency(source_name)
+        parsed = None
+
+        def render(function_name):
+            nonlocal parsed
+            if parsed is None:
+                parsed = self.source_cache.parse(source_name)
+            return self._format_function(
+                parsed.get_text(function_name),
+                source,
+                function_name,
+                language,
+                filename,
+            )
+
+        snippets = [
+            self._cached(
+                functools.partial(render, function_name),
+                self._function_key(source, function_name, language, filename),
+                source_name,
+            )
+            for function_name in function_names
+        ]
+        if separator is None:
+            return snippets
+        return separator.join(snippets)
+
+    def import_repl(self, source, session=None):
+        """ Run source in a REPL and return the transcript. Blocks naming the
+        same session share one console for the whole render, always run in
+        this process.
+        """
+        if session is None:
+            return self._cached(
+                lambda: self._import_repl(source), ("import_repl", source)
+            )
+
+        from .repl import ReplSession
+
+        repl_session = self.repl_sessions.get(session)
+        if repl_session is None:
+            repl_session = self.repl_sessions[session] = ReplSession()
+        ran = []
+
+        def render():
+            ran.append(source)
+            return repl_session.run(source)
+
+        # the transcript depends on every block before it in the session
+        text = self._cached(
+            render, ("import_repl", source, tuple(repl_session.history))
+        )
+        if not ran:
+            repl_session.skip(source)
+        return text
+
+    def reset_repl(self, session):
+        """ Start the next block of session in a fresh console. """
+        self.repl_sessions.pop(session, None)
+        return ""
+
+    def _import_repl(self, source):
+        if self.pending_repl is not None:
+            return self.pending_repl.result(source)
+
+        from .repl import run_repl
+
+        return run_repl(source)
+
+    def prefetch_repl(self, sources):
+        """ Start running REPL blocks in the worker pool before the render
+        gets to them. Blocks already in the fragment cache are skipped.
+        """
+        if self.pending_repl is None:
+            return
+        for source in sources:
+            if self.fragment_cache is not None:
+                key = self.fragment_cache.key("import_repl", source)
+                if self.fragment_cache.has(key):
+                    continue
+            self.pending_repl.submit(source)
+
+    def prefetch_sources(self, calls):
+        """ Start reading the files that import_source, import_function and
+        import_functions will need, parsing them for the last two, in a pool
+        of threads so the render finds them in the source cache. calls are the
+        (directive, args, kwargs) found in the template, including set_path so
+        the files can be found; a set_path whose argument isn't known stops
+        the prefetch until the next one that is. Files whose output is already
+        in the fragment cache are skipped. Returns the executor, for the
+        caller to shut down, or None if there is nothing to fetch.
+        """
+        path = self.path
+        show_skipped = self.show_skipped
+        wanted = {}
+        for directive, args, kwargs in calls:
+            bound = None
+            if args is not None:
+                try:
+                    bound = _signature(directive).bind(self, *args, **kwargs)
+                except TypeError:
+                    pass  # the render will report the bad arguments
+            if directive == "set_path":
+                if bound is None:
+                    path = None
+                else:
+                    path = pathlib.Path(bound.arguments["path"])
+                    show_skipped = bound.arguments.get("show_skipped", False)
+                continue
+            if path is None or bound is None:
+                continue
+            source_name = path / bound.arguments["source"]
+            parse = directive != "import_source"
+            if directive == "import_source":
+                keys = [
+                    self._source_key(*args, show_skipped=show_skipped, **kwargs)
+                ]
+            elif directive == "import_function":
+                if bound.arguments.get("fast"):
+                    continue  # parsing the whole file is what it avoids
+                keys = [self._function_key(*args, **kwargs)]
+            else:
+                arguments = dict(bound.arguments)
+                names = arguments.pop("function_names")
+                if not isinstance(names, (list, tuple)):
+                    continue
+                arguments.pop("separator", None)
+                del arguments["self"]
+                keys = [
+                    self._function_key(function_name=name, **arguments)
+                    for name in names
+                ]
+            wanted.setdefault((source_name, parse), []).extend(keys)
+
+        wanted = {
+            (source_name, parse): keys
+            for (source_name, parse), keys in wanted.items()
+            if not self.source_cache.is_loaded(source_name, parse)
+        }
+        if not wanted:
+            return None
+        import concurrent.futures
+
+        executor = concurrent.futures.ThreadPoolExecutor(
+            min(len(wanted), 8), thread_name_prefix="markplates-prefetch"
+        )
+        for (source_name, parse), keys in wanted.items():
+            executor.submit(self._prefetch, source_name, parse, keys)
+        return executor
+
+    def _prefetch(self, source_name, parse, keys):
+        if self.fragment_cache is not None:
+            try:
+                digest = self.source_cache.digest(source_name)
+            except OSError:
+                return
+            fragment_cache = self.fragment_cache
+            if all(
+                fragment_cache.has(fragment_cache.key(*key, digest))
+                for key in keys
+            ):
+                return
+        self.source_cache.preload(source_name, parse)
+
+
+@functools.lru_cache(maxsize=None)
+def _signature(directive):
+    import inspect
+
+    return inspect.signature(getattr(TemplateState, directive))
+
+
+def _collapse_blanks(lines):
+    """ Copies lines into a list, leaving out blank lines at the start and
+    blank lines which follow another blank line. Returns the list and the
+    smallest indent of its non-blank lines, or None if there are none.
+    """
+    kept = []
+    lead = None
+    prev_blank = True  # a blank line at the start is left out
+    for line in lines:
+        text = line.lstrip()
+        if text:
+            indent = len(line) - len(text)
+            if lead is None or indent < lead:
+                lead = indent
+        elif prev_blank:
+            continue
+        kept.append(line)
+        prev_blank = not text
+    return kept, lead
 
 
 def remove_double_blanks(lines):
     """ Takes a list of lines and condenses multiple blank lines into a single
     blank line.
     """
-    new_lines = []
-    prev_line = ""  # empty line here will remove leading blank space
-    for line in lines:
-        if len(line.strip()) or len(prev_line.strip()):
-            new_lines.append(line)
-        prev_line = line
-    return new_lines
+    return _collapse_blanks(lines)[0]
+
+
+def _common_lead(lines):
+    """ The smallest indent of the non-blank lines, or None if every line is
+    blank.
+    """
+    return min(
+        (
+            len(line) - len(line.lstrip())
+            for line in lines
+            if line and not line.isspace()
+        ),
+        default=None,
+    )
 
 
 def left_justify(lines):
@@ -177,118 +712,463 @@ def left_justify(lines):
     line so that at least one line is left-justified.
     WARNING: this will fail on mixed tabs and spaces. Don't do that.
     """
-    leads = [
-        len(line) - len(line.lstrip()) for line in lines if len(line.strip())
-    ]
-    if not leads:  # degenerate case where there are only blank lines
+    lead = _common_lead(lines)
+    if lead is None:  # degenerate case where there are only blank lines
         return lines
-    min_lead = min(leads)
-    new_lines = []
-    for line in lines:
-        if len(line.strip()):
-            new_lines.append(line[min_lead:])
+    return [line[lead:] if line.strip() else line for line in lines]
+
+
+_SPACES_LINE = re.compile(r" *$")
+
+
+def _snippet_pieces(lines, end, lead, source, language, filename):
+    if language:
+        language = language.lower()
+        if language in ["c", "cpp", "c++"]:
+            language = "cpp"
+        yield "```%s\n" % language
+    if filename:
+        yield "# %s\n" % source
+    if lead:
+        for index in range(end):
+            line = lines[index]
+            # blank lines are kept as they are
+            yield line if line.isspace() else line[lead:]
+    else:
+        yield from itertools.islice(lines, end)
+    if language:
+        yield "```"
+
+
+def format_snippet(lines, source, language=None, filename=False, lead=None):
+    """ Turns the lines of a snippet into the text that goes into the
+    template: trailing lines of spaces are dropped, the rest are left-justified
+    together as left_justify() does, and a "# source" line and a fence for
+    language are added if asked for. lines is never copied or changed. It is
+    read twice, once to find the indent and once to build the text, unless
+    the indent is given as lead.
+    """
+    end = len(lines)
+    while end and _SPACES_LINE.match(lines[end - 1]):
+        end -= 1
+    if lead is None:
+        lead = _common_lead(lines) or 0
+    return "".join(
+        _snippet_pieces(lines, end, lead, source, language, filename)
+    ).rstrip()
+
+
+def _parse_range(_range, line_count):
+    """ Converts one range into a (start, end) pair of line numbers, both
+    inclusive. line_count is needed to resolve $.
+    """
+    # For the single line instances, just convert to int().  This will
+    # cover values that are already ints and '3'.
+    try:
+        rint = int(_range)
+        return rint, rint
+    except ValueError:
+        pass
+
+    if _range == "$":
+        # $ on its own means last line
+        return line_count, line_count
+
+    # If it's not a single line, look for a range
+    start, end = _range.split("-")
+    if start == "$":
+        # Support negative indexing on lines, end will be the last
+        # line, start will be the last line minus the "end" value
+        # in the range
+        return line_count - int(end), line_count
+
+    # Start of range is a number, check for $ on end first
+    end = line_count if end.strip() == "$" else int(end)
+    return int(start), end
+
+
+def _merge_ranges(intervals):
+    """ Sorts (start, end) pairs and combines any which overlap or touch. """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
         else:
-            new_lines.append(line)
-    return new_lines
+            merged.append([start, end])
+    return merged
 
 
-def condense_ranges(input_lines, ranges, source_name):
+def condense_ranges(input_lines, ranges, source_name, show_skipped=False):
     """ Takes a list of ranges and produces a sorted list of lines from the
     input file.
     Ranges can be in the following form:
         3 or "3" : an integer adds just that line from the input
         "5-7" : a range adds lines between start and end inclusive (so 5, 6, 7)
         "10-$" : an unlimited range includes start line to the end of the file
+        "$" : the last line
+        "$-3" : the last line and the three lines before it
     LINE NUMBERING STARTS AT 1!
-    The algorithm to do this is wildly inefficient. There is almost certainly a
-    clever way to use array slices to pull this off, but I found it easier to
-    normalize the line numbers (i.e. got them in sorted order and removed
-    duplicate number and combined overlaps) by simply creating a list of lines.
+    Each range is turned into a (start, end) interval, the intervals are sorted
+    and merged where they overlap, and each is then copied out as a slice, so
+    the work depends on the number of ranges rather than the number of lines.
+    With show_skipped, a "# ..." line marks each gap of more than two lines.
     """
-    output_numbers = set()
+    return list(
+        _iter_ranges(
+            input_lines,
+            _resolve_ranges(input_lines, ranges, source_name),
+            show_skipped,
+        )
+    )
+
+
+def _resolve_ranges(input_lines, ranges, source_name):
+    """ Turns ranges into sorted, merged (start, end) intervals of
+    input_lines. Exits if they go past the end of the file.
+    """
+    line_count = len(input_lines)
+    intervals = []
     for _range in ranges:
-        # For the single line instances, just convert to int().  This will
-        # cover values that are already ints and '3'.
-        try:
-            rint = int(_range)
-            output_numbers.add(rint)
-        except ValueError:
-            if _range == "$":
-                # $ on its own means last line
-                output_numbers.add(len(input_lines))
-            else:
-                # If it's not a single line, look for a range
-                start, end = _range.split("-")
-                if start == "$":
-                    # Support negative indexing on lines, end will be the last
-                    # line, start will be the last line minus the "end" value
-                    # in the range
-                    count = int(end)
-                    end = len(input_lines)
-                    start = end - count
-                else:
-                    # Start of range is a number
-                    start = int(start)
-                    # check for $ on end first
-                    end = len(input_lines) if end.strip() == "$" else int(end)
-                # output_numbers.update(list(range(start, end+1)))
-                output_numbers.update(range(start, end + 1))
-    output_numbers = sorted(output_numbers)
+        start, end = _parse_range(_range, line_count)
+        # lines before the first are ignored, as are empty ranges
+        start = max(start, 1)
+        if start <= end:
+            intervals.append((start, end))
+    intervals = _merge_ranges(intervals)
+
     # fail if they explicitly requested beyond the end of the file
-    if len(input_lines) < output_numbers[-1]:
+    if intervals and line_count < intervals[-1][1]:
         print(
-            f"Requested {output_numbers[-1]} lines from {source_name}. "
+            f"Requested {intervals[-1][1]} lines from {source_name}. "
             "Past end of file!"
         )
         sys.exit(1)
-    if g_indicate_skipped_lines:
-        output = []
-        for index, line_number in enumerate(output_numbers):
-            line = input_lines[line_number - 1]
-            output.append(line)
-            if (
-                index + 1 < len(output_numbers)
-                and output_numbers[index + 1] - output_numbers[index] > 2
-            ):
-                if len(input_lines[line_number - 2]) != 0:
-                    output.append("\n")
-
-                num_indent = len(line) - len(line.lstrip())
-                prefix = " " * num_indent
-                output.append(f"{prefix}# ...\n")
-                if len(input_lines[line_number]) != 0:
-                    output.append("\n")
-    else:
-        output = [input_lines[number - 1] for number in output_numbers]
+    return intervals
+
+
+def _iter_ranges(input_lines, intervals, show_skipped=False):
+    """ Yields the lines of input_lines in intervals, as condense_ranges()
+    returns them.
+    """
+    for index, (start, end) in enumerate(intervals):
+        yield from input_lines[start - 1 : end]
+        if not show_skipped or index + 1 == len(intervals):
+            continue
+        # mark gaps of two or more lines between sections
+        if intervals[index + 1][0] - end > 2:
+            line = input_lines[end - 1]
+            if len(input_lines[end - 2]) != 0:
+                yield "\n"
+
+            num_indent = len(line) - len(line.lstrip())
+            prefix = " " * num_indent
+            yield f"{prefix}# ...\n"
+            if len(input_lines[end]) != 0:
+                yield "\n"
+
+
+# Used by process_template when it isn't given an environment
+_shared_environments = {}
+
+
+def _shared_environment(square):
+    from .environment import make_environment
+
+    square = bool(square)
+    if square not in _shared_environments:
+        _shared_environments.setdefault(square, make_environment(square))
+    return _shared_environments[square]
+
+
+def generate_template(
+    template,
+    square,
+    source_cache=None,
+    dependencies=None,
+    environment=None,
+    fragment_cache=None,
+    repl_pool=None,
+    profiler=None,
+    prefetch=True,
+    concurrent=False,
+):
+    """ Render the template, yielding the output a piece at a time as it is
+    produced rather than building it all in memory. The arguments are the
+    same as for process_template().
+    """
+    # the render's include root and loaded templates are context variables,
+    # so each render gets a context of its own to step in, leaving other
+    # renders being consumed in the same thread alone
+    context = contextvars.copy_context()
+    chunks = _generate_template(
+        template,
+        square,
+        source_cache,
+        dependencies,
+        environment,
+        fragment_cache,
+        repl_pool,
+        profiler,
+        prefetch,
+        concurrent,
+    )
+    try:
+        while True:
+            try:
+                chunk = context.run(next, chunks)
+            except StopIteration:
+                return
+            yield chunk
+    finally:
+        context.run(chunks.close)
+
+
+def _generate_template(
+    template,
+    square,
+    source_cache,
+    dependencies,
+    environment,
+    fragment_cache,
+    repl_pool,
+    profiler,
+    prefetch,
+    concurrent,
+):
+    from .environment import _loaded_templates
+    from .environment import _template_root
+
+    if environment is None:
+        environment = _shared_environment(square)
+    template = pathlib.Path(template).resolve()
+    name = str(template)
+
+    loaded = set()
+    loaded_token = _loaded_templates.set(loaded)
+    root_token = _template_root.set(str(template.parent))
+    template_state = TemplateState(source_cache, fragment_cache, repl_pool)
+    executor = None
+    deferral = None
+    if profiler is not None:
+        # prefetched reads would be made by threads of their own, leaving the
+        # directives that wanted them looking free
+        prefetch = False
+    try:
+        if prefetch or repl_pool is not None:
+            from .scan import directive_calls
+
+            calls = list(
+                directive_calls(
+                    environment,
+                    name,
+                    {
+                        "set_path",
+                        "import_source",
+                        "import_function",
+                        "import_functions",
+                        "import_repl",
+                    },
+                    dynamic=True,
+                )
+            )
+            template_state.prefetch_repl(
+                args[0]
+                for directive, args, kwargs in calls
+                if directive == "import_repl"
+                and args
+                and len(args) == 1
+                and not kwargs
+            )
+            if prefetch:
+                executor = template_state.prefetch_sources(
+                    call for call in calls if call[0] != "import_repl"
+                )
+        template = environment.get_template(name)
+        functions = {
+            item: getattr(template_state, item)
+            for item in dir(TemplateState)
+            if not item.startswith("__")
+        }
+        if concurrent:
+            from .parallel import Deferral
+
+            deferral = Deferral(template_state)
+            deferral.record(template, functions)
+            functions = deferral.replay(functions)
+        if profiler is not None:
+            profiler.instrument(template_state, functions)
+        yield from template.generate(functions)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if deferral is not None:
+            deferral.shutdown()
+        _template_root.reset(root_token)
+        _loaded_templates.reset(loaded_token)
+        # recorded even if the render failed, so that fixing the missing file
+        # can be noticed
+        if dependencies is not None:
+            dependencies.update(loaded)
+            dependencies.update(template_state.dependencies)
+
+
+def process_template(
+    template,
+    square,
+    source_cache=None,
+    dependencies=None,
+    environment=None,
+    fragment_cache=None,
+    repl_pool=None,
+    profiler=None,
+    prefetch=True,
+    concurrent=False,
+):
+    """ Render the template and return the result. If a dependencies set is
+    passed in, the resolved paths of the template, anything it includes and
+    every source file it imports are added to it. An environment from
+    make_environment() can be passed in, otherwise one shared by every call is
+    used, and a FragmentCache to reuse directive output from earlier runs.
+    With a ReplPool, import_repl blocks run in worker processes, all of them
+    starting before the render begins. A Profiler records the cost of each
+    directive call. With prefetch, the source files named in the template are
+    read and parsed in background threads while it renders. With concurrent,
+    the directives themselves run in threads, all at once; see parallel.py.
+    """
+    return "".join(
+        generate_template(
+            template,
+            square,
+            source_cache,
+            dependencies,
+            environment,
+            fragment_cache,
+            repl_pool,
+            profiler,
+            prefetch,
+            concurrent,
+        )
+    )
+
+
+class Renderer:
+    """ Renders templates, holding on to everything that can be reused from
+    one render to the next: a jinja2 Environment for each delimiter style, so
+    unchanged templates aren't compiled again, and the SourceCache. With a
+    bytecode_cache_dir, compiled templates are also kept on disk for later
+    runs. The fragment_cache, repl_pool, profiler, prefetch and concurrent
+    settings are passed on to each render.
+
+    A Renderer can be shared between threads, rendering any number of
+    templates at once. Nothing is shared between renders except the caches;
+    the settings made by set_path() belong to the render that made them.
+    import_repl blocks run in this process take turns, as they capture the
+    process-wide stdout; with a repl_pool they run in parallel.
+    """
+
+    def __init__(
+        self,
+        square=False,
+        source_cache=None,
+        fragment_cache=None,
+        repl_pool=None,
+        bytecode_cache_dir=None,
+        profiler=None,
+        prefetch=True,
+        concurrent=False,
+    ):
+        self.square = square
+        if source_cache is None:
+            source_cache = SourceCache()
+        self.source_cache = source_cache
+        self.fragment_cache = fragment_cache
+        self.repl_pool = repl_pool
+        self.bytecode_cache_dir = bytecode_cache_dir
+        self.profiler = profiler
+        self.prefetch = prefetch
+        self.concurrent = concurrent
+        self._environments = {}
+        self._lock = threading.Lock()
+        # identifies copies of this renderer sent to other processes
+        self.id = uuid.uuid4().hex
+
+    def __getstate__(self):
+        # environments and parsed sources are rebuilt rather than copied
+        state = self.__dict__.copy()
+        state["_environments"] = {}
+        state["source_cache"] = SourceCache()
+        # profiles are only collected in the process that asked for them
+        state["profiler"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def options(self):
+        """ The settings which change the output, as recorded in manifests. """
+        return {"square": self.square}
+
+    def environment(self, square=None):
+        """ The Environment for the square or default delimiters. """
+        square = self.square if square is None else bool(square)
+        with self._lock:
+            return self._environment(square)
 
-    return output
+    def _environment(self, square):
+        if square not in self._environments:
+            import jinja2
+            from .environment import make_environment
 
+            bytecode_cache = None
+            if self.bytecode_cache_dir is not None:
+                directory = pathlib.Path(self.bytecode_cache_dir)
+                directory.mkdir(parents=True, exist_ok=True)
+                bytecode_cache = jinja2.FileSystemBytecodeCache(str(directory))
+            self._environments[square] = make_environment(
+                square, bytecode_cache
+            )
+        return self._environments[square]
+
+    def generate(self, template, dependencies=None, square=None):
+        """ Render template, yielding the output a piece at a time. """
+        return generate_template(
+            template,
+            self.square if square is None else square,
+            self.source_cache,
+            dependencies,
+            self.environment(square),
+            self.fragment_cache,
+            self.repl_pool,
+            self.profiler,
+            self.prefetch,
+            self.concurrent,
+        )
 
-def process_template(template, square):
-    # alias the block start and stop strings as they conflict with the
-    # templating on RealPython.  Currently these are unused here.
-    file_loader = jinja2.FileSystemLoader(str(template.parent))
+    def render(self, template, dependencies=None, square=None):
+        """ Render template and return the result. """
+        return "".join(self.generate(template, dependencies, square))
 
-    kwargs = {
-        "loader":file_loader, 
-        "block_start_string":"&&&&", 
-        "block_end_string":"&&&&"
-    }
 
-    if square:
-        kwargs.update({
-            'variable_start_string':'[[',
-            'variable_end_string':']]',
-        })
+class _SkipLines:
+    """ Collects streamed text, dropping everything up to and including the
+    first count newlines.
+    """
 
-    env = jinja2.Environment(**kwargs)
-    template = env.get_template(str(template.name))
+    def __init__(self, count):
+        self.to_skip = count
+        self.kept = io.StringIO()
 
-    template_state = TemplateState()
-    for item in dir(TemplateState):
-        if not item.startswith("__"):
-            template.globals[item] = getattr(template_state, item)
-    return template.render()
+    def write(self, chunk):
+        while self.to_skip and chunk:
+            end = chunk.find("\n")
+            if end < 0:
+                return
+            chunk = chunk[end + 1 :]
+            self.to_skip -= 1
+        self.kept.write(chunk)
 
 
 @click.command(context_settings=dict(help_option_names=["-h", "--help"]))
@@ -299,22 +1179,287 @@ def process_template(template, square):
 @click.option(
     "-s", "--square", is_flag=True, help="Use [[ ]] for template tags"
 )
-@click.argument("template", type=str)
-def main(verbose, clip, square, template):
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(),
+    help="File to write the rendered template to, or directory to write "
+    "many rendered templates into",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of worker processes for rendering many templates",
+)
+@click.option(
+    "--concurrent",
+    is_flag=True,
+    help="Run the directives in each template at the same time, in threads",
+)
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    help="Render every template even if its inputs haven't changed",
+)
+@click.option(
+    "-w",
+    "--watch",
+    is_flag=True,
+    help="Keep running and re-render templates when their files change",
+)
+@click.option(
+    "--check",
+    is_flag=True,
+    help="Report templates whose rendered markdown is out of date, without "
+    "writing anything. Give a template and its markdown file, or use -o",
+)
+@click.option(
+    "--serve",
+    is_flag=True,
+    help="Serve the rendered templates over HTTP on localhost",
+)
+@click.option(
+    "--port",
+    type=click.IntRange(min=0, max=65535),
+    default=8000,
+    show_default=True,
+    help="Port for --serve",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    envvar="MARKPLATES_CACHE_DIR",
+    help="Keep compiled templates and rendered fragments in this directory "
+    "to reuse between runs",
+)
+@click.option(
+    "--cache-size",
+    type=click.IntRange(min=1),
+    default=100,
+    show_default=True,
+    help="Maximum size of the fragment cache in MB",
+)
+@click.option(
+    "--clear-cache",
+    is_flag=True,
+    help="Remove the cached fragments and templates first",
+)
+@click.option(
+    "--repl-workers",
+    type=click.IntRange(min=1),
+    help="Run import_repl blocks in this many worker processes",
+)
+@click.option(
+    "--repl-timeout",
+    type=click.FloatRange(min=0),
+    help="Seconds a REPL block may run for. Implies --repl-workers",
+)
+@click.option(
+    "--repl-memory",
+    type=click.IntRange(min=1),
+    help="Memory limit for each REPL block in MB. Implies --repl-workers",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Print the time taken by each directive call to stderr",
+)
+@click.option(
+    "--profile-json",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the directive timings to this JSON file",
+)
+@click.argument("templates", nargs=-1, type=str)
+def main(
+    verbose,
+    clip,
+    square,
+    output,
+    jobs,
+    concurrent,
+    force,
+    watch,
+    check,
+    serve,
+    port,
+    cache_dir,
+    cache_size,
+    clear_cache,
+    repl_workers,
+    repl_timeout,
+    repl_memory,
+    profile,
+    profile_json,
+    templates,
+):
+    from . import batch
+    from . import fragments
+    from . import manifest
+
+    if clear_cache:
+        if not cache_dir:
+            raise click.UsageError("--clear-cache needs --cache-dir")
+        # only remove what markplates put there, as the directory may be one
+        # the user keeps other things in
+        directory = pathlib.Path(cache_dir)
+        fragments.FragmentCache(directory / "fragments").clear()
+        shutil.rmtree(directory / "bytecode", ignore_errors=True)
+        if not templates:
+            return
+    if not templates:
+        raise click.UsageError("Missing argument 'TEMPLATES...'")
+
+    fragment_cache = None
+    bytecode_cache_dir = None
+    if cache_dir:
+        fragment_cache = fragments.FragmentCache(
+            pathlib.Path(cache_dir, "fragments"), cache_size * 1024 * 1024
+        )
+        bytecode_cache_dir = pathlib.Path(cache_dir, "bytecode")
+
+    if repl_timeout == 0:
+        raise click.BadParameter(
+            "must be more than 0", param_hint="'--repl-timeout'"
+        )
+    repl_pool = None
+    if repl_workers or repl_timeout or repl_memory:
+        from . import repl
+
+        repl_pool = repl.ReplPool(
+            repl_workers,
+            repl_timeout,
+            repl_memory * 1024 * 1024 if repl_memory else None,
+        )
+    profiler = None
+    if profile or profile_json:
+        if jobs > 1:
+            raise click.UsageError("--profile only works with a single job")
+        from .profile import Profiler
+
+        profiler = Profiler()
+    renderer = Renderer(
+        square,
+        fragment_cache=fragment_cache,
+        repl_pool=repl_pool,
+        bytecode_cache_dir=bytecode_cache_dir,
+        profiler=profiler,
+        concurrent=concurrent,
+    )
+
+    expected = None
+    if check and not output:
+        if len(templates) != 2:
+            raise click.UsageError(
+                "--check needs a template and its markdown file, or -o"
+            )
+        templates, expected = templates[:1], pathlib.Path(templates[1])
+    templates = batch.expand_templates(templates)
+    if len(templates) > 1 and not (output or serve):
+        raise click.UsageError("Use -o when rendering many templates")
+    if clip and (output or watch or serve):
+        raise click.UsageError("-c only works when printing a single template")
+    if serve and (output or watch):
+        raise click.UsageError("--serve can't be used with -o or -w")
+    if check and (clip or watch or serve):
+        raise click.UsageError("--check can't be used with -c, -w or --serve")
+    from jinja2 import TemplateNotFound
+
     try:
-        output = process_template(pathlib.Path(template), square)
-        print(output)
+        if check:
+            from . import check as checker
+
+            if output and batch.is_file_output(output, templates):
+                expected = pathlib.Path(output)
+            if expected is not None:
+                build = manifest.Manifest(
+                    expected.parent / manifest.MANIFEST_NAME
+                )
+                stale = []
+                if checker.is_stale(templates[0], expected, renderer, build):
+                    stale.append(expected)
+            else:
+                build = manifest.Manifest(
+                    pathlib.Path(output) / manifest.MANIFEST_NAME
+                )
+                stale = checker.check_batch(templates, output, renderer, build)
+            for name in stale:
+                print(f"Out of date: {name}", file=sys.stderr)
+            if verbose:
+                print(
+                    f"Checked {len(templates)}, {len(stale)} out of date",
+                    file=sys.stderr,
+                )
+            if stale:
+                sys.exit(1)
+            return
+
+        if serve:
+            from .serve import PreviewServer
+
+            try:
+                server = PreviewServer(templates, renderer, port=port)
+            except ValueError as e:
+                raise click.UsageError(str(e))
+            print(f"Serving on {server.url}", file=sys.stderr)
+            server.serve_forever()
+            return
+
+        if watch:
+            from . import watch as watcher
+
+            if output and batch.is_file_output(output, templates):
+                session = watcher.WatchSession(
+                    templates, renderer=renderer, output_file=output
+                )
+            else:
+                session = watcher.WatchSession(templates, output, renderer)
+            session.run()
+            return
+
+        if output and batch.is_file_output(output, templates):
+            output = pathlib.Path(output)
+            build = manifest.Manifest(output.parent / manifest.MANIFEST_NAME)
+            if batch.render_file(templates[0], output, renderer, build, force):
+                if verbose:
+                    print(f"Wrote {output}", file=sys.stderr)
+            return
+
+        if output:
+            build = manifest.Manifest(
+                pathlib.Path(output) / manifest.MANIFEST_NAME
+            )
+            try:
+                written = batch.render_batch(
+                    templates, output, renderer, jobs, build, force
+                )
+            except ValueError as e:
+                raise click.UsageError(str(e))
+            if verbose:
+                for name in written:
+                    print(f"Wrote {name}", file=sys.stderr)
+            return
+
+        # copy lines to clipboard, but skip the first title and the
+        # subsequent blank line
+        clipped = _SkipLines(2) if clip else None
+        for chunk in renderer.generate(templates[0]):
+            sys.stdout.write(chunk)
+            if clipped:
+                clipped.write(chunk)
+        sys.stdout.write("\n")
         sys.stdout.flush()
         if clip:
-            # copy lines to clipboard, but skip the first title and the
-            # subsequent blank line
-            lines = output.split("\n")
-            to_clip = "\n".join(lines[2:])
+            to_clip = clipped.kept.getvalue()
 
             # NOTE: there seems to be a bug in pyperclip that is emitting output
             # to stdout when the clipboard gets too large. Redirecting stdout
             # to devnull seems to resolve the issue (along with the flush()
             # above).  This is ugly, but works
+            import pyperclip
+
             fdnull = os.open(os.devnull, os.O_WRONLY)
             os.dup2(fdnull, 1)
             try:
@@ -325,6 +1470,13 @@ def main(verbose, clip, square, template):
     except FileNotFoundError as e:
         print(f"Unable to import file:{e.filename}", file=sys.stderr)
         sys.exit(1)
-    except jinja2.exceptions.TemplateNotFound as e:
+    except TemplateNotFound as e:
         print(f"Unable to import file:{e}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        if repl_pool is not None:
+            repl_pool.shutdown()
+        if profile:
+            profiler.report()
+        if profile_json:
+            profiler.write_json(profile_json)
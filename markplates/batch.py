@@ -0,0 +1,141 @@
+""" Render many templates in one process, optionally spread across a pool of
+worker processes.
+"""
+import glob
+import pathlib
+
+from .__main__ import Renderer
+from .output import write_chunks
+
+# Renderers are sent to worker processes by value. Each worker keeps the first
+# copy of a renderer it sees for its lifetime, so a source file used by several
+# templates is only parsed, and each template only compiled, once per worker.
+# Only workers fill it in; in the parent the renderer passed in is used as is.
+_worker_renderers = {}
+
+
+def expand_templates(patterns):
+    """ Turns a list of file names and glob patterns into a list of template
+    paths. Names without wildcards, and patterns that match nothing, are passed
+    through untouched so the missing file is reported when it's rendered.
+    """
+    templates = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        if glob.has_magic(pattern) and matches:
+            templates.extend(sorted(matches))
+        else:
+            templates.append(pattern)
+    # drop duplicates but keep the order they were given in
+    return [pathlib.Path(t) for t in dict.fromkeys(templates)]
+
+
+def is_file_output(output, templates):
+    """-o names a single output file, rather than a directory, when there is
+    just one template and output is an existing file or, if it doesn't exist,
+    has a suffix such as .md.
+    """
+    output = pathlib.Path(output)
+    if len(templates) != 1 or output.is_dir():
+        return False
+    return output.is_file() or bool(output.suffix)
+
+
+def output_path(template, output_dir):
+    """ The rendered markdown for a.mdt is written to output_dir/a.md """
+    return pathlib.Path(output_dir) / (pathlib.Path(template).stem + ".md")
+
+
+def render_one(template, output, renderer):
+    """ Render template to output. Returns the set of files it read and
+    whether output changed; it is not touched if the text is the same.
+    """
+    dependencies = set()
+    chunks = renderer.generate(pathlib.Path(template), dependencies)
+    changed = write_chunks(output, chunks)
+    return dependencies, changed
+
+
+def _render_in_worker(template, output, renderer):
+    """ render_one() in a pool worker, with the worker's copy of renderer. """
+    renderer = _worker_renderers.setdefault(renderer.id, renderer)
+    return render_one(template, output, renderer)
+
+
+def render_file(template, output, renderer=None, manifest=None, force=False):
+    """ Render template into the file output, like render_batch() does for a
+    directory. Returns True if output changed.
+    """
+    if renderer is None:
+        renderer = Renderer()
+    output = pathlib.Path(output)
+    options = renderer.options()
+    if not force and manifest is not None:
+        if manifest.is_current(template, output, options):
+            return False
+    output.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        dependencies, changed = render_one(template, output, renderer)
+        if manifest is not None:
+            manifest.record(template, output, options, dependencies)
+    finally:
+        if manifest is not None:
+            manifest.save()
+    return changed
+
+
+def render_batch(
+    templates, output_dir, renderer=None, jobs=1, manifest=None, force=False
+):
+    """ Render each template into output_dir with renderer, or a default
+    Renderer. With jobs > 1 the templates are handed out to a pool of that many
+    worker processes. If a Manifest is given, templates whose inputs haven't
+    changed since it was recorded are skipped, unless force is set, and the
+    manifest is updated for the rest. Returns the list of files whose
+    contents changed; outputs which come out the same are left untouched.
+    """
+    if renderer is None:
+        renderer = Renderer()
+    output_dir = pathlib.Path(output_dir)
+    outputs = [output_path(template, output_dir) for template in templates]
+    if len(set(outputs)) != len(outputs):
+        raise ValueError("Templates with the same name would overwrite output")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    options = renderer.options()
+    todo = [
+        (template, output)
+        for template, output in zip(templates, outputs)
+        if manifest is None
+        or force
+        or not manifest.is_current(template, output, options)
+    ]
+
+    written = []
+    try:
+        if jobs <= 1 or len(todo) <= 1:
+            for template, output in todo:
+                dependencies, changed = render_one(template, output, renderer)
+                if changed:
+                    written.append(output)
+                if manifest is not None:
+                    manifest.record(template, output, options, dependencies)
+        else:
+            import concurrent.futures
+
+            with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+                futures = [
+                    pool.submit(_render_in_worker, template, output, renderer)
+                    for template, output in todo
+                ]
+                for (template, output), future in zip(todo, futures):
+                    dependencies, changed = future.result()
+                    if changed:
+                        written.append(output)
+                    if manifest is not None:
+                        manifest.record(template, output, options, dependencies)
+    finally:
+        # keep whatever was rendered before a failure
+        if manifest is not None:
+            manifest.save()
+    return written
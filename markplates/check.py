@@ -0,0 +1,40 @@
+""" Check that rendered markdown is up to date without writing anything.
+
+A fresh render is compared with the existing file as it streams out, stopping
+at the first difference. With a Manifest, templates whose inputs and output
+haven't changed since they were rendered aren't rendered at all.
+"""
+import pathlib
+
+from .__main__ import Renderer
+from .batch import output_path
+from .output import matches
+
+
+def is_stale(template, output, renderer=None, manifest=None):
+    """ True if output isn't what template renders to now. """
+    if renderer is None:
+        renderer = Renderer()
+    if manifest is not None and manifest.is_current(
+        template, output, renderer.options()
+    ):
+        return False
+    chunks = renderer.generate(pathlib.Path(template))
+    try:
+        return not matches(output, chunks)
+    finally:
+        chunks.close()
+
+
+def check_batch(templates, output_dir, renderer=None, manifest=None):
+    """ Return the outputs in output_dir which are out of date with their
+    templates, as render_batch() would name them.
+    """
+    if renderer is None:
+        renderer = Renderer()
+    stale = []
+    for template in templates:
+        output = output_path(template, output_dir)
+        if is_stale(template, output, renderer, manifest):
+            stale.append(output)
+    return stale
@@ -0,0 +1,80 @@
+""" The jinja2 side of rendering, kept apart so that jinja2 is only imported
+once something is actually rendered.
+"""
+import contextvars
+import os
+import pathlib
+
+import jinja2
+
+# Set to a set() during a render to collect the files of every template used
+_loaded_templates = contextvars.ContextVar("_loaded_templates", default=None)
+# The directory of the template being rendered, which includes are relative to
+_template_root = contextvars.ContextVar("_template_root", default=None)
+
+
+class _PathLoader(jinja2.BaseLoader):
+    """ Loads templates by their full path, so one Environment can serve
+    templates from any directory.
+    """
+
+    def get_source(self, environment, template):
+        path = pathlib.Path(template)
+        try:
+            mtime = path.stat().st_mtime_ns
+            source = path.read_text(encoding="utf-8")
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            raise jinja2.TemplateNotFound(template)
+
+        def uptodate():
+            try:
+                return path.stat().st_mtime_ns == mtime
+            except OSError:
+                return False
+
+        return source, str(path), uptodate
+
+
+class _RecordingEnvironment(jinja2.Environment):
+    """ An Environment which notes the file behind every template it hands
+    out, including ones from its cache, so that includes show up as
+    dependencies of the render.
+    """
+
+    def join_path(self, template, parent):
+        # includes are found relative to the directory of the template being
+        # rendered, as they were when each directory had its own loader
+        root = _template_root.get()
+        if root is None:
+            root = os.path.dirname(parent)
+        return str(pathlib.Path(root, template).resolve())
+
+    def _load_template(self, name, globals):
+        template = super()._load_template(name, globals)
+        loaded = _loaded_templates.get()
+        if loaded is not None and template.filename:
+            loaded.add(str(pathlib.Path(template.filename).resolve()))
+        return template
+
+
+def make_environment(square, bytecode_cache=None):
+    """ Create a jinja2 Environment for rendering templates. It can be reused
+    for any number of renders, from any directory, and only recompiles a
+    template when its file changes. A jinja2 BytecodeCache can be given to keep
+    compiled templates between runs.
+    """
+    # alias the block start and stop strings as they conflict with the
+    # templating on RealPython.  Currently these are unused here.
+    kwargs = {
+        "loader": _PathLoader(),
+        "bytecode_cache": bytecode_cache,
+        "block_start_string": "&&&&",
+        "block_end_string": "&&&&",
+    }
+
+    if square:
+        kwargs.update(
+            {"variable_start_string": "[[", "variable_end_string": "]]"}
+        )
+
+    return _RecordingEnvironment(**kwargs)
@@ -0,0 +1,158 @@
+""" A persistent, content addressed cache of rendered fragments.
+
+The text produced by import_source, import_function and import_repl depends
+only on the arguments and the contents of the file being imported. Storing it
+on disk, keyed on a hash of those, lets later runs skip the work entirely.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import sys
+import tempfile
+import threading
+
+# Bump this whenever the output of a directive changes for the same inputs
+FORMAT_VERSION = 1
+
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+_HEX = frozenset("0123456789abcdef")
+
+
+def _is_fragment(name):
+    return len(name) == 64 and _HEX.issuperset(name)
+
+
+class FragmentCache:
+    """ Stores fragments as files under directory, named by the sha256 of the
+    key. When the total size goes over max_bytes the least recently used
+    fragments are removed. It can be shared between threads.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # total bytes on disk, worked out on first write
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def key(self, *parts):
+        """ Combine the parts into a key. Anything json can encode is fine. """
+        data = json.dumps(
+            [FORMAT_VERSION, sys.version, parts], default=str
+        ).encode()
+        return hashlib.sha256(data).hexdigest()
+
+    def _path(self, key):
+        return self.directory / key[:2] / key
+
+    def get(self, key):
+        """ Return the cached text for key, or None. """
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+        except (FileNotFoundError, NotADirectoryError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        # mark it as recently used so eviction keeps it around
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return text
+
+    def has(self, key):
+        """ True if key is in the cache, without counting it as a use. """
+        return self._path(key).is_file()
+
+    def put(self, key, text):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = text.encode("utf-8")
+        # write to a temporary file and rename so that other processes sharing
+        # the cache never see half a fragment
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_name, path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        """(path, size, last used) for every fragment in the cache. """
+        for path in self.directory.glob("??/*"):
+            if path.name.startswith(".tmp"):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            yield path, stat.st_size, stat.st_mtime_ns
+
+    def evict(self):
+        """ Remove the least recently used fragments until the cache fits in
+        three quarters of max_bytes, leaving room to grow before the next
+        eviction.
+        """
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 3 // 4
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+    def clear(self):
+        """ Remove every fragment. Only the files put() writes are removed,
+        so anything else in directory is left alone.
+        """
+        with self._lock:
+            for shard in self.directory.glob("??"):
+                if not shard.is_dir() or not _HEX.issuperset(shard.name):
+                    continue
+                for path in shard.iterdir():
+                    if _is_fragment(path.name) or path.name.startswith(".tmp"):
+                        try:
+                            path.unlink()
+                        except OSError:
+                            pass
+                try:
+                    shard.rmdir()
+                except OSError:
+                    # something else is in there
+                    pass
+            self._size = 0
@@ -0,0 +1,98 @@
+""" Random access to the lines of a large file without reading all of it.
+
+import_source only needs the lines named in its ranges, but readlines() keeps
+the whole file in memory. A LineIndex scans the file once, remembering where
+every step'th line starts, and then reads just the lines asked for.
+"""
+import array
+import collections.abc
+import itertools
+import locale
+import re
+
+# a line ending in "\r\n", "\r" or "\n", or the last line with none
+_LINE = re.compile(rb"[^\r\n]*(?:\r\n?|\n)|[^\r\n]+")
+
+
+def _raw_lines(f):
+    """ The lines of the binary file f from where it is, each with its line
+    ending, split at "\\n", "\\r\\n" or a lone "\\r" as universal newlines
+    are.
+    """
+    for line in f:
+        if b"\r" in line:
+            yield from _LINE.findall(line)
+        else:
+            yield line
+
+
+class LineIndex(collections.abc.Sequence):
+    """ A read-only sequence of the lines in path, as readlines() would return
+    them, with "\\r\\n" and "\\r" line endings translated to "\\n" as
+    universal newlines do. Only the offset of every step'th line is kept, so
+    the index is small even for huge files; reaching any other line means
+    reading forward from the nearest one.
+    """
+
+    def __init__(self, path, step=256, encoding=None):
+        self.path = path
+        self.step = step
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self._offsets = array.array("Q")
+        self._count = 0
+        self._scan()
+
+    def _scan(self):
+        offset = 0
+        count = 0
+        with open(self.path, "rb") as f:
+            # checking a whole block for "\r" is far quicker than checking
+            # each line, so files without any keep to the fast path
+            blocks = iter(lambda: f.read(1 << 16), b"")
+            has_cr = any(b"\r" in block for block in blocks)
+            f.seek(0)
+            for line in _raw_lines(f) if has_cr else f:
+                if count % self.step == 0:
+                    self._offsets.append(offset)
+                offset += len(line)
+                count += 1
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def _decode(self, line):
+        text = line.decode(self.encoding)
+        if text.endswith("\r\n"):
+            text = text[:-2] + "\n"
+        elif text.endswith("\r"):
+            text = text[:-1] + "\n"
+        return text
+
+    def _read(self, start, stop):
+        """ The lines from start up to, but not including, stop. """
+        lines = []
+        if start >= stop:
+            return lines
+        checkpoint = start // self.step
+        skip = start - checkpoint * self.step
+        with open(self.path, "rb") as f:
+            f.seek(self._offsets[checkpoint])
+            for line in itertools.islice(
+                _raw_lines(f), skip, skip + stop - start
+            ):
+                lines.append(self._decode(line))
+        return lines
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, stride = index.indices(self._count)
+            if stride != 1:
+                return self._read(0, self._count)[index]
+            return self._read(start, stop)
+
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("line index out of range")
+        return self._read(index, index + 1)[0]
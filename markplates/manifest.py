@@ -0,0 +1,118 @@
+""" Records what went into each rendered template so that later runs can skip
+templates whose inputs have not changed.
+
+The manifest is a JSON file mapping each template to the output it produced,
+the options it was rendered with and a fingerprint of every file it read, and
+of the output as it was written.
+"""
+import hashlib
+import json
+import os
+import pathlib
+
+MANIFEST_NAME = ".markplates-manifest.json"
+
+
+def file_digest(path):
+    """ sha256 of the file's contents as a hex string. """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return {
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": file_digest(path),
+    }
+
+
+class Manifest:
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self._dirty = False
+        try:
+            with open(self.path) as f:
+                self._entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            # a missing or damaged manifest just means everything is rebuilt
+            self._entries = {}
+
+    @staticmethod
+    def _key(template):
+        return str(pathlib.Path(template).resolve())
+
+    def _input_unchanged(self, path, recorded):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if (stat.st_mtime_ns, stat.st_size) == (
+            recorded["mtime_ns"],
+            recorded["size"],
+        ):
+            return True
+        # the file has been touched, but the content may still be the same
+        if stat.st_size != recorded["size"]:
+            return False
+        if file_digest(path) != recorded["sha256"]:
+            return False
+        # remember the new mtime so the next check is cheap
+        recorded["mtime_ns"] = stat.st_mtime_ns
+        self._dirty = True
+        return True
+
+    def is_current(self, template, output, options):
+        """ True if output was rendered from template with these options and
+        neither it nor any of the files read have changed since.
+        """
+        entry = self._entries.get(self._key(template))
+        if entry is None:
+            return False
+        if entry["output"] != str(output) or entry["options"] != options:
+            return False
+        if "written" not in entry:
+            return False  # from a version which didn't record the output
+        if not self._input_unchanged(output, entry["written"]):
+            return False
+        return all(
+            self._input_unchanged(path, recorded)
+            for path, recorded in entry["inputs"].items()
+        )
+
+    def record(self, template, output, options, dependencies):
+        """ Note that output was rendered from template and what it read. """
+        inputs = {}
+        try:
+            for path in sorted(dependencies):
+                inputs[path] = _fingerprint(path)
+            written = _fingerprint(output)
+        except OSError:
+            # can't fingerprint it, so never consider this entry current
+            self.forget(template)
+            return
+        self._entries[self._key(template)] = {
+            "output": str(output),
+            "options": options,
+            "inputs": inputs,
+            "written": written,
+        }
+        self._dirty = True
+
+    def forget(self, template):
+        if self._entries.pop(self._key(template), None) is not None:
+            self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
@@ -0,0 +1,85 @@
+""" Writing rendered output to files. """
+import codecs
+import itertools
+import locale
+import os
+import pathlib
+import tempfile
+
+# output is written as open() would write text by default, in the locale's
+# encoding with os.linesep line endings
+_ENCODING = locale.getpreferredencoding(False)
+
+
+def _new_file_mode():
+    # the only way to read the umask is to set it
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def _same_contents(new, old):
+    """ True if the files new and old hold the same bytes. """
+    try:
+        if os.path.getsize(new) != os.path.getsize(old):
+            return False
+        with open(new, "rb") as a, open(old, "rb") as b:
+            while True:
+                block = a.read(1 << 16)
+                if block != b.read(1 << 16):
+                    return False
+                if not block:
+                    return True
+    except OSError:
+        return False
+
+
+def write_chunks(path, chunks):
+    """ Write each string from chunks to path, followed by a newline to match
+    what is printed to stdout. The text goes to a temporary file that replaces
+    path once it is complete, so a failed render never leaves a partial file.
+    If path already holds exactly the same bytes it is left alone, keeping its
+    mtime, and False is returned; otherwise True.
+    """
+    path = pathlib.Path(path)
+    try:
+        mode = path.stat().st_mode & 0o777
+    except FileNotFoundError:
+        mode = _new_file_mode()
+
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w", encoding=_ENCODING) as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.write("\n")
+        if _same_contents(tmp_name, path):
+            os.unlink(tmp_name)
+            return False
+        os.chmod(tmp_name, mode)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+    return True
+
+
+def matches(path, chunks):
+    """ True if path holds exactly the bytes write_chunks() would write for
+    chunks. Stops reading, and taking chunks, at the first difference.
+    """
+    try:
+        f = open(path, "rb")
+    except (FileNotFoundError, IsADirectoryError):
+        return False
+    encoder = codecs.getincrementalencoder(_ENCODING)()
+    with f:
+        try:
+            for chunk in itertools.chain(chunks, ["\n"]):
+                data = encoder.encode(chunk.replace("\n", os.linesep))
+                if f.read(len(data)) != data:
+                    return False
+            data = encoder.encode("", final=True)
+            return f.read(len(data) + 1) == data
+        except UnicodeEncodeError:
+            return False
@@ -0,0 +1,133 @@
+""" Work out the directives of a template at the same time as each other.
+
+Jinja runs each directive when the render reaches it, so a template with ten
+slow directives runs them one after another. With concurrent rendering the
+template is rendered twice. The first pass only collects the directive calls:
+each returns an empty string at once and its work goes to a pool of threads,
+along with the path that set_path() had given it. The second pass is an
+ordinary render, except that each directive takes the result of the matching
+call from the first pass, waiting for it if it isn't ready.
+
+As the second pass is a normal render, the output is exactly what a sequential
+render gives. Any call the first pass didn't see, because the template does
+something with what a directive returns, is simply run when it is reached.
+So are REPL blocks, which have to run in template order as they share the
+state of the process, unless they run in a ReplPool; even then blocks in a
+session run in order.
+"""
+import collections
+import concurrent.futures
+import copy
+
+from . import profile
+
+# the directives whose work can be done in the pool
+DEFERRED = [
+    "import_source",
+    "import_function",
+    "import_functions",
+    "import_repl",
+]
+
+
+def _in_session(name, args, kwargs):
+    """ True for a REPL block in a session, which has to wait for the blocks
+    before it.
+    """
+    if name != "import_repl":
+        return False
+    session = args[1] if len(args) > 1 else kwargs.get("session")
+    return session is not None
+
+
+def _call_key(name, template_state, args, kwargs):
+    return (
+        name,
+        template_state.path,
+        template_state.show_skipped,
+        repr(args),
+        repr(sorted(kwargs.items())),
+    )
+
+
+class Deferral:
+    """ The directive calls collected from the first pass of a render, and
+    the threads working them out.
+    """
+
+    def __init__(self, template_state, max_workers=None):
+        self.template_state = template_state
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers, thread_name_prefix="markplates-directive"
+        )
+        self.pending = collections.defaultdict(collections.deque)
+        # REPL blocks run in this process would gain nothing, taking turns
+        # with the console anyway, and could run out of order
+        self.deferred = [
+            name
+            for name in DEFERRED
+            if name != "import_repl" or template_state.pending_repl is not None
+        ]
+
+    def record(self, template, functions):
+        """ Render template once, submitting the directive calls it makes.
+        Any error is left for the second pass to report.
+        """
+        # the first pass has settings of its own, but adds to the same
+        # dependencies
+        state = copy.copy(self.template_state)
+        recording = {name: getattr(state, name) for name in functions}
+        for name in DEFERRED:
+            if name in recording:
+                recording[name] = self._submitter(name, state)
+        # sessions are left alone until the second pass
+        recording["reset_repl"] = lambda *args, **kwargs: ""
+        try:
+            for _ in template.generate(recording):
+                pass
+        except (Exception, SystemExit):
+            pass
+
+    def _submitter(self, name, state):
+        def submit(*args, **kwargs):
+            # the calls left for the second pass aren't run here at all
+            if name not in self.deferred or _in_session(name, args, kwargs):
+                return ""
+            # a copy keeps the path in force at this point in the template
+            function = getattr(copy.copy(state), name)
+            future = self.executor.submit(
+                profile.measured, function, *args, **kwargs
+            )
+            self.pending[_call_key(name, state, args, kwargs)].append(future)
+            return ""
+
+        return submit
+
+    def replay(self, functions):
+        """ Returns functions with the directives replaced by ones which use
+        the results of the first pass.
+        """
+        functions = dict(functions)
+        for name in self.deferred:
+            if name in functions:
+                functions[name] = self._replayer(name, functions[name])
+        return functions
+
+    def _replayer(self, name, function):
+        state = self.template_state
+
+        def replay(*args, **kwargs):
+            pending = self.pending.get(_call_key(name, state, args, kwargs))
+            if pending:
+                text, stats = pending.popleft().result()
+                # the work was done in the pool, but this call is what needed
+                # it
+                profile.count(stats.bytes_read, stats.cache_hits)
+                return text
+            return function(*args, **kwargs)
+
+        return replay
+
+    def shutdown(self):
+        """ Drop any calls the second pass didn't use. """
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,199 @@
+""" Measure where the time goes while rendering.
+
+A Profiler wraps the directive functions handed to a template so that every
+call records its wall time, the bytes of source read, the lines it emitted and
+the cache hits it got, grouped by the place in the template it was called
+from. Nothing is wrapped unless a Profiler is passed in.
+
+Reads and cache hits are charged to the call that made them through a context
+variable, so calls running at the same time in other threads, or other
+renders sharing the caches, don't show up in each other's figures.
+"""
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+
+# how far up the stack to look for the template making the call
+_MAX_DEPTH = 10
+
+
+# the CallStats of the directive call being measured in this context, if any
+_current = contextvars.ContextVar("markplates_call_stats", default=None)
+
+
+class CallStats:
+    """ What a single directive call has read so far. """
+
+    __slots__ = ["bytes_read", "cache_hits"]
+
+    def __init__(self):
+        self.bytes_read = 0
+        self.cache_hits = 0
+
+
+def count(bytes_read=0, cache_hits=0):
+    """ Charge bytes_read and cache_hits to the directive call being measured,
+    if there is one.
+    """
+    stats = _current.get()
+    if stats is not None:
+        stats.bytes_read += bytes_read
+        stats.cache_hits += cache_hits
+
+
+def measured(function, *args, **kwargs):
+    """ Call function and return its result along with a CallStats of what it
+    read, whose figures can be passed to count() later to charge them to another
+    call.
+    """
+    stats = CallStats()
+    token = _current.set(stats)
+    try:
+        return function(*args, **kwargs), stats
+    finally:
+        _current.reset(token)
+
+
+def _call_site():
+    """ The (template name, line number) of the template code calling the
+    directive, or ("?", 0) if it can't be found.
+    """
+    frame = sys._getframe(2)
+    for _ in range(_MAX_DEPTH):
+        if frame is None:
+            break
+        template = frame.f_globals.get("__jinja_template__")
+        if template is not None:
+            lineno = template.get_corresponding_lineno(frame.f_lineno)
+            return template.filename or template.name, lineno
+        frame = frame.f_back
+    return "?", 0
+
+
+class SiteStats:
+    """ Totals for the calls made from one place in a template. """
+
+    __slots__ = ["calls", "seconds", "bytes_read", "lines", "cache_hits"]
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.bytes_read = 0
+        self.lines = 0
+        self.cache_hits = 0
+
+
+def _line_count(text):
+    """ The lines in a directive's output, which import_functions() may give
+    as a list.
+    """
+    if isinstance(text, list):
+        return sum(map(_line_count, text))
+    return text.count("\n") + 1 if text else 0
+
+
+class Profiler:
+    """ Collects SiteStats for every directive call site across any number of
+    renders.
+    """
+
+    directives = [
+        "import_source",
+        "import_function",
+        "import_functions",
+        "import_repl",
+        "reset_repl",
+        "set_path",
+    ]
+
+    def __init__(self):
+        self.sites = {}
+        self._lock = threading.Lock()
+
+    def instrument(self, template_state, functions):
+        """ Replace the directives in functions, the dict of names given to
+        the template, with timed versions.
+        """
+        for name in self.directives:
+            if name in functions:
+                functions[name] = self._wrap(name, functions[name])
+
+    def _wrap(self, name, function):
+        def timed(*args, **kwargs):
+            template, lineno = _call_site()
+            stats = CallStats()
+            token = _current.set(stats)
+            start = time.perf_counter()
+            text = ""
+            try:
+                text = function(*args, **kwargs)
+                return text
+            finally:
+                # failed calls are recorded too, they can be slow as well
+                seconds = time.perf_counter() - start
+                _current.reset(token)
+                self._record(
+                    (template, lineno, name),
+                    seconds,
+                    stats.bytes_read,
+                    _line_count(text),
+                    stats.cache_hits,
+                )
+
+        return timed
+
+    def _record(self, site, seconds, bytes_read, lines, cache_hits):
+        with self._lock:
+            stats = self.sites.get(site)
+            if stats is None:
+                stats = self.sites[site] = SiteStats()
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.bytes_read += bytes_read
+            stats.lines += lines
+            stats.cache_hits += cache_hits
+
+    def rows(self):
+        """ One dict per call site, slowest first. """
+        rows = [
+            {
+                "template": template,
+                "line": lineno,
+                "directive": directive,
+                "calls": stats.calls,
+                "seconds": stats.seconds,
+                "bytes_read": stats.bytes_read,
+                "lines": stats.lines,
+                "cache_hits": stats.cache_hits,
+            }
+            for (template, lineno, directive), stats in self.sites.items()
+        ]
+        rows.sort(key=lambda row: row["seconds"], reverse=True)
+        return rows
+
+    def report(self, out=None):
+        """ Print the rows as a table, to stderr by default. """
+        out = out if out is not None else sys.stderr
+        header = (
+            f"{'ms':>10} {'calls':>6} {'bytes read':>11} {'lines':>7} "
+            f"{'hits':>5}  call site"
+        )
+        print(header, file=out)
+        for row in self.rows():
+            template = row["template"]
+            if template != "?":
+                template = os.path.relpath(template)
+            print(
+                f"{row['seconds'] * 1e3:>10.3f} {row['calls']:>6} "
+                f"{row['bytes_read']:>11} {row['lines']:>7} "
+                f"{row['cache_hits']:>5}  "
+                f"{template}:{row['line']} {row['directive']}",
+                file=out,
+            )
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.rows(), f, indent=1)
@@ -0,0 +1,323 @@
+""" Find a function, class or assignment in a Python file without parsing all
+of it.
+
+For huge generated modules, such as protobuf stubs, parsing the whole file to
+quote one small function costs far more than the function is worth. Here the
+file is read a line at a time, following just enough of the syntax, brackets,
+strings and backslashes, to tell where each statement starts and how far it
+is indented. Reading stops at the end of the definition. Statements which
+might be the one wanted are tokenized to check, and the dotted name is looked
+for at each level the same way _index_symbols() indexes it. Once found, only
+the lines of the definition are parsed, so the text is exactly what
+find_in_source() gives. Whenever the answer can't be settled this way
+Undecided is raised, and the caller should parse the file instead.
+"""
+import ast
+import io
+import keyword
+import re
+import sys
+import tokenize
+
+from . import spans
+
+_INTERESTING = re.compile(r"[#'\"()\[\]{}\\]")
+_STRING_ENDS = {}
+for _quote in "'\"":
+    _STRING_ENDS[_quote] = re.compile(
+        r"(?:[^%s\\\n]|\\.)*%s" % (_quote, _quote), re.S
+    )
+    _STRING_ENDS[_quote * 3] = re.compile(
+        r"(?:[^\\]|\\.)*?%s" % (_quote * 3), re.S
+    )
+# from 3.12 an f-string can hold strings using the same quotes
+_NESTED_FSTRINGS = sys.version_info >= (3, 12)
+_FSTRING_PREFIX = re.compile(r"[fF][rR]?$|[rR][fF]$")
+_SKIPPED = (
+    tokenize.NL,
+    tokenize.COMMENT,
+    tokenize.ENCODING,
+    tokenize.INDENT,
+    tokenize.DEDENT,
+    tokenize.ENDMARKER,
+)
+# the token after the name at the start of an assignment statement
+_ASSIGN_NEXT = {"=", ".", "[", ","}
+
+
+class Undecided(Exception):
+    """ The answer can't be settled without parsing the whole file. """
+
+
+class _LineState:
+    """ Follows the brackets, strings and backslashes that carry a statement
+    from one line to the next.
+    """
+
+    def __init__(self):
+        self.nesting = 0
+        self.quote = None  # the quotes of the string the line ended in
+        self.continued = False
+
+    @property
+    def complete(self):
+        """ True if the statement ended with the last line fed. """
+        return self.nesting == 0 and self.quote is None and not self.continued
+
+    def feed(self, line):
+        self.continued = False
+        pos = 0
+        if self.quote is not None:
+            end = _STRING_ENDS[self.quote].match(line)
+            if end is None:
+                self._still_open(line, self.quote)
+                return
+            pos = end.end()
+            self.quote = None
+        while True:
+            match = _INTERESTING.search(line, pos)
+            if match is None:
+                return
+            char = match.group()
+            pos = match.end()
+            if char == "#":
+                return
+            elif char in "([{":
+                self.nesting += 1
+            elif char in ")]}":
+                self.nesting -= 1
+                if self.nesting < 0:
+                    raise Undecided("unbalanced brackets")
+            elif char == "\\":
+                if line[pos:].strip("\r\n"):
+                    raise Undecided("backslash outside a string")
+                self.continued = True
+                return
+            else:
+                start = match.start()
+                quote = char * 3 if line.startswith(char * 3, start) else char
+                if _NESTED_FSTRINGS and _FSTRING_PREFIX.search(line, 0, start):
+                    raise Undecided("f-string")
+                end = _STRING_ENDS[quote].match(line, start + len(quote))
+                if end is None:
+                    self._still_open(line, quote)
+                    return
+                pos = end.end()
+
+    def _still_open(self, line, quote):
+        if len(quote) == 1 and not line.rstrip("\r\n").endswith("\\"):
+            raise Undecided("unterminated string")
+        self.quote = quote
+
+
+def _column(line):
+    """ The column of the first character of line, as tokenize counts it. """
+    indent = line[: len(line) - len(line.lstrip(" \t\f"))]
+    if "\f" in indent:
+        raise Undecided("form feed in the indent")
+    return len(indent.expandtabs(8))
+
+
+def _split_statements(tokens):
+    """ The tokens of each statement on a logical line, splitting at
+    semicolons outside brackets.
+    """
+    statements = [[]]
+    nesting = 0
+    for token in tokens:
+        if token.type == tokenize.OP:
+            if token.string in "([{":
+                nesting += 1
+            elif token.string in ")]}":
+                nesting -= 1
+            elif token.string == ";" and nesting == 0:
+                statements.append([])
+                continue
+        statements[-1].append(token)
+    return statements
+
+
+def _is_assignment(statement):
+    """ True if statement, which starts with a name, is a plain assignment
+    rather than an annotated one or an expression.
+    """
+    if len(statement) < 2 or statement[1].string not in _ASSIGN_NEXT:
+        return False
+    nesting = 0
+    for token in statement:
+        if token.type != tokenize.OP:
+            continue
+        if token.string in "([{":
+            nesting += 1
+        elif token.string in ")]}":
+            nesting -= 1
+        elif nesting == 0 and token.string == "=":
+            return True
+        elif nesting == 0 and token.string == ":":
+            return False
+    return False
+
+
+def _has_body_on_line(statement):
+    """ True if the compound statement's body follows its colon on the same
+    line.
+    """
+    nesting = 0
+    for index, token in enumerate(statement):
+        if token.type != tokenize.OP:
+            continue
+        if token.string in "([{":
+            nesting += 1
+        elif token.string in ")]}":
+            nesting -= 1
+        elif token.string == ":" and nesting == 0:
+            return statement[index + 1].type != tokenize.NEWLINE
+    raise Undecided("no colon")
+
+
+def _match(text, name):
+    """ Returns ("def", one_line) if the logical line text is the header of a
+    function or class called name, one_line being True if its body is on the
+    same line, ("assign", True) if it assigns to name, and (None, False)
+    otherwise.
+    """
+    try:
+        tokens = [
+            token
+            for token in tokenize.generate_tokens(io.StringIO(text).readline)
+            if token.type not in _SKIPPED
+        ]
+    except (tokenize.TokenError, SyntaxError) as e:
+        raise Undecided(str(e))
+    statements = _split_statements(tokens)
+    for statement in statements[1:]:
+        if statement and statement[0].string == name:
+            raise Undecided("more than one statement on the line")
+
+    first = statements[0]
+    if first[0].string in ("def", "class"):
+        if len(first) > 1 and first[1].string == name:
+            return "def", _has_body_on_line(first)
+    elif first[0].string == name and _is_assignment(first):
+        return "assign", True
+    return None, False
+
+
+def _locate(readline, parts):
+    """ Returns the lines of the definition of parts, a dotted name split up,
+    and whether it is a function or class ("def") or an assignment.
+    """
+    state = _LineState()
+    level = 0
+    want = 0  # the column of the statements in the container searched
+    container = None  # the column of a container whose body is next
+    decorated = None  # the line of the first decorator seen
+    found = None  # the first line and column of the definition
+    kind = None
+    statement = None  # the first line of the statement being read
+    lines = []
+    first = 1  # the line number of lines[0]
+    lineno = 0
+    for line in iter(readline, ""):
+        lineno += 1
+        if statement is None:
+            text = line.lstrip(" \t\f")
+            if text and text[0] not in "#\r\n":
+                statement = lineno
+                column = _column(line)
+                if found is not None:
+                    if column <= found[1]:
+                        break
+                else:
+                    if container is not None:
+                        if column <= container:
+                            raise Undecided("empty container")
+                        want = column
+                        container = None
+                    elif column < want:
+                        raise Undecided("not in the first container")
+                    if decorated is None:
+                        lines = []
+                        first = lineno
+        lines.append(line)
+        state.feed(line)
+        if statement is None or not state.complete:
+            continue
+
+        text = "".join(lines[statement - first :])
+        start = statement
+        statement = None
+        if found is not None:
+            end = lineno
+            continue
+        if column != want:
+            continue
+        if text.lstrip()[:1] == "@":
+            if decorated is None:
+                decorated = start
+            continue
+        if decorated is not None:
+            start = decorated
+            decorated = None
+        if parts[level] not in text:
+            continue
+
+        kind, one_line = _match(text, parts[level])
+        if level + 1 < len(parts):
+            if kind == "def":
+                if one_line:
+                    raise Undecided("container on one line")
+                level += 1
+                container = column
+            continue
+        if kind is not None:
+            found, end = (start, column), lineno
+            if one_line:
+                break
+
+    if found is None:
+        raise Undecided("not found")
+    return "".join(lines[found[0] - first : end - first + 1]), kind
+
+
+def find(readline, name):
+    """ The code for the function, class or assignment name in the source
+    read with readline, matching find_in_source(). Raises Undecided if that
+    can't be done without parsing the whole of it.
+    """
+    parts = name.split(".")
+    if not spans.SUPPORTED or not all(
+        part.isidentifier() and not keyword.iskeyword(part) for part in parts
+    ):
+        raise Undecided("not a plain name")
+
+    text, kind = _locate(readline, parts)
+    if text[:1] in (" ", "\t"):
+        # an indented block needs something to belong to
+        prefix = "if 1:\n"
+    else:
+        prefix = ""
+    text = prefix + text
+
+    try:
+        tree = ast.parse(text)
+    except SyntaxError as e:
+        raise Undecided(str(e))
+    node = tree.body[0].body[0] if prefix else tree.body[0]
+    source_spans = spans.SourceSpans(text)
+    try:
+        if kind == "def":
+            if (
+                node.__class__ not in (ast.FunctionDef, ast.ClassDef)
+                or node.name != parts[-1]
+            ):
+                raise Undecided("not the expected definition")
+        elif (
+            node.__class__ != ast.Assign
+            or source_spans.first_token(node) != parts[-1]
+        ):
+            raise Undecided("not the expected assignment")
+        start, end = source_spans.span(node)
+    except spans.Unsupported as e:
+        raise Undecided(str(e))
+    return text[start:end] + "\n"
@@ -0,0 +1,231 @@
+""" Running import_repl blocks.
+
+run_repl() runs a block in this process, and a ReplSession runs a series of
+blocks in one console so that each sees what the ones before it set up.
+ReplPool runs blocks in separate worker interpreters, several at a time, with
+limits on how long each block may take and how much memory it may use.
+Workers are started with "python -m markplates.repl", which reads a block on
+stdin and writes the transcript to stdout.
+"""
+import code
+import collections
+import concurrent.futures
+import contextlib
+import io
+import os
+import pathlib
+import subprocess
+import sys
+import threading
+
+# run_repl swaps sys.stdout and sys.stderr, which every thread shares
+_console_lock = threading.Lock()
+
+
+def run_repl(source):
+    """ Run each line of source through an interactive console and return a
+    transcript of the session, prompts included. Only one thread at a time
+    can run a block.
+    """
+    with _console_lock:
+        return _run_repl(source)
+
+
+def _run_repl(source, console=None):
+    # split into individual lines
+    lines = source.split("\n")
+    # it's a bit cleaner to start the first line of code on the line after
+    # the start of the string, so remove a single blank line from the start
+    # if it's present
+    if len(lines[0]) == 0:
+        lines.pop(0)
+
+    # set up the console and prompts
+    if console is None:
+        console = code.InteractiveConsole()
+    ps1 = ">>> "
+    prompt = ps1
+
+    with io.StringIO() as output:
+        with contextlib.redirect_stdout(output):
+            with contextlib.redirect_stderr(output):
+                ps2 = "... "
+                for line in lines:
+                    # don't show prompt on blank lines - spacing looks
+                    # better this way
+                    if len(line) != 0:
+                        print(f"{prompt}{line}")
+                    else:
+                        print()
+                    console.push(line)
+                    if line.endswith(":"):
+                        prompt = ps2
+                    elif len(line) == 0:
+                        prompt = ps1
+        # an unfinished statement doesn't carry over into the next block
+        console.resetbuffer()
+        # Trim trailing blank lines
+        outputString = output.getvalue()
+        while outputString[-1] == "\n":
+            outputString = outputString[:-1]
+            # degenerate case of entirely empty repl block
+            # still return a single blank line
+            if len(outputString) < 2:
+                return outputString
+        return outputString
+
+
+class ReplSession:
+    """ A console kept between the import_repl blocks of one session, so that
+    expensive setup only runs once. Blocks whose transcripts came from
+    somewhere else, such as the fragment cache, are only run, with their
+    output thrown away, once a later block needs what they left behind.
+    """
+
+    def __init__(self):
+        self.history = []  # every block in the session so far
+        self._console = None
+        self._run = 0  # how many blocks of history the console has run
+
+    def run(self, source):
+        """ Run source after the blocks before it and return its
+        transcript.
+        """
+        with _console_lock:
+            if self._console is None:
+                self._console = code.InteractiveConsole()
+            for skipped in self.history[self._run :]:
+                _run_repl(skipped, self._console)
+            transcript = _run_repl(source, self._console)
+        self.history.append(source)
+        self._run = len(self.history)
+        return transcript
+
+    def skip(self, source):
+        """ Note that source comes next, without running it yet. """
+        self.history.append(source)
+
+
+class ReplPool:
+    """ Runs REPL blocks in fresh worker interpreters, up to workers at a
+    time. Each block gets its own process, so nothing leaks from one block to
+    the next, a block running longer than timeout seconds is killed and a
+    TimeoutError raised, and memory_limit caps each worker's address space in
+    bytes where the platform supports it.
+    """
+
+    def __init__(self, workers=None, timeout=None, memory_limit=None):
+        self.workers = workers or os.cpu_count()
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # the executor stays behind when a pool is sent to another process
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _command(self):
+        command = [sys.executable, "-m", "markplates.repl"]
+        if self.memory_limit:
+            command.append(str(self.memory_limit))
+        return command
+
+    def _environment(self):
+        # make sure the worker imports this copy of markplates
+        package_root = str(pathlib.Path(__file__).resolve().parent.parent)
+        env = os.environ.copy()
+        paths = [package_root]
+        if env.get("PYTHONPATH"):
+            paths.append(env["PYTHONPATH"])
+        env["PYTHONPATH"] = os.pathsep.join(paths)
+        env["PYTHONIOENCODING"] = "utf-8"
+        return env
+
+    def _run_in_worker(self, source):
+        try:
+            result = subprocess.run(
+                self._command(),
+                input=source.encode("utf-8"),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                timeout=self.timeout,
+                env=self._environment(),
+            )
+        except subprocess.TimeoutExpired:
+            raise TimeoutError(
+                f"REPL block timed out after {self.timeout} seconds"
+            ) from None
+        if result.returncode != 0:
+            raise RuntimeError(
+                "REPL worker failed: "
+                + result.stderr.decode("utf-8", errors="replace")
+            )
+        return result.stdout.decode("utf-8")
+
+    def submit(self, source):
+        """ Start running source and return a Future for its transcript. """
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.workers
+                )
+            return self._executor.submit(self._run_in_worker, source)
+
+    def run(self, source):
+        return self.submit(source).result()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+class PendingBlocks:
+    """ REPL blocks submitted to a pool ahead of the render reaching them.
+    Identical blocks are handed out in the order they were submitted.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._futures = collections.defaultdict(collections.deque)
+
+    def submit(self, source):
+        self._futures[source].append(self.pool.submit(source))
+
+    def result(self, source):
+        """ The transcript for source, from a block submitted earlier if there
+        is one, otherwise running it now.
+        """
+        pending = self._futures.get(source)
+        if pending:
+            return pending.popleft().result()
+        return self.pool.run(source)
+
+
+def _limit_memory(limit):
+    try:
+        import resource
+    except ImportError:
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _worker_main(argv):
+    if argv:
+        _limit_memory(int(argv[0]))
+    source = sys.stdin.buffer.read().decode("utf-8")
+    sys.stdout.buffer.write(run_repl(source).encode("utf-8"))
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    _worker_main(sys.argv[1:])
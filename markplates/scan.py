@@ -0,0 +1,59 @@
+""" Find the directives a template will call before rendering it.
+
+Only calls whose arguments are all literals can be known ahead of time;
+anything computed while rendering is skipped, or reported without its
+arguments. Included templates are not followed.
+"""
+import functools
+
+import jinja2
+from jinja2 import nodes
+
+
+def _literal(node):
+    """ The python value of a literal node. Raises ValueError otherwise. """
+    try:
+        return node.as_const()
+    except nodes.Impossible:
+        raise ValueError("not a literal")
+
+
+def directive_calls(environment, name, directives, dynamic=False):
+    """ Yield (directive, args, kwargs) for each call in the template name
+    to a function in directives with literal arguments, in template order.
+    With dynamic, other calls are included too, with args and kwargs of None.
+    """
+    try:
+        source, _, _ = environment.loader.get_source(environment, name)
+        calls = _scan(environment, name, source, frozenset(directives), dynamic)
+    except (jinja2.TemplateError, OSError):
+        # rendering will report the problem properly
+        return
+    yield from calls
+
+
+@functools.lru_cache(maxsize=256)
+def _scan(environment, name, source, directives, dynamic):
+    """ The calls in source, kept so that a template which hasn't changed
+    isn't parsed again on every render.
+    """
+    tree = environment.parse(source, name)
+    return tuple(_calls(tree, directives, dynamic))
+
+
+def _calls(tree, directives, dynamic):
+    for call in tree.find_all(nodes.Call):
+        if not isinstance(call.node, nodes.Name):
+            continue
+        if call.node.name not in directives:
+            continue
+        try:
+            if call.dyn_args is not None or call.dyn_kwargs is not None:
+                raise ValueError("not a literal")
+            args = [_literal(arg) for arg in call.args]
+            kwargs = {kw.key: _literal(kw.value) for kw in call.kwargs}
+        except ValueError:
+            if dynamic:
+                yield call.node.name, None, None
+            continue
+        yield call.node.name, args, kwargs
@@ -0,0 +1,162 @@
+""" A local HTTP server for previewing rendered templates.
+
+Each template is served at /name.md, rendered when it is asked for by a
+Renderer kept for the life of the server, so compiled templates, parsed
+sources and file lines stay in memory between requests. Pages carry an ETag
+made from the contents of every file they read; while those don't change the
+last rendering is reused, and a conditional request gets a 304 without any
+rendering at all.
+"""
+import hashlib
+import html
+import http.server
+import json
+import pathlib
+import threading
+import urllib.parse
+
+from .__main__ import Renderer
+from .batch import output_path
+
+
+class Page:
+    """ The last rendering of a template. """
+
+    def __init__(self, body, etag, dependencies):
+        self.body = body
+        self.etag = etag
+        self.dependencies = dependencies
+
+
+def _matches(if_none_match, etag):
+    """ True if the If-None-Match header value lists etag. """
+    if not if_none_match or etag is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or "W/" + etag in tags
+
+
+class PreviewServer:
+    """ Serves the rendered templates from host:port. Port 0 picks a free
+    port, which is then available as self.port.
+    """
+
+    def __init__(self, templates, renderer=None, host="127.0.0.1", port=8000):
+        self.renderer = renderer if renderer is not None else Renderer()
+        self.pages = {}
+        for template in templates:
+            name = output_path(template, "").name
+            if name in self.pages:
+                raise ValueError(f"Two templates would be served as {name}")
+            self.pages[name] = pathlib.Path(template)
+        self._rendered = {}
+        self._lock = threading.Lock()
+        self.httpd = http.server.ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.preview = self
+        self.host, self.port = self.httpd.server_address[:2]
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/"
+
+    def etag(self, dependencies):
+        """ An ETag for a page which read dependencies, or None if one of them
+        can't be read.
+        """
+        digest = hashlib.sha256(
+            json.dumps(self.renderer.options(), sort_keys=True).encode()
+        )
+        for name in sorted(dependencies):
+            try:
+                file_hash = self.renderer.source_cache.digest(name)
+            except OSError:
+                return None
+            digest.update(f"{name}\0{file_hash}\0".encode())
+        return '"%s"' % digest.hexdigest()[:32]
+
+    def page(self, template, if_none_match=None):
+        """ Returns (status, etag, body) for a request for template. """
+        with self._lock:
+            page = self._rendered.get(template)
+        if (
+            page is not None
+            and page.etag is not None
+            and self.etag(page.dependencies) == page.etag
+        ):
+            if _matches(if_none_match, page.etag):
+                return 304, page.etag, b""
+            return 200, page.etag, page.body
+
+        dependencies = {str(template.resolve())}
+        text = self.renderer.render(template, dependencies)
+        body = (text + "\n").encode("utf-8")
+        page = Page(body, self.etag(dependencies), dependencies)
+        with self._lock:
+            self._rendered[template] = page
+        if _matches(if_none_match, page.etag):
+            return 304, page.etag, b""
+        return 200, page.etag, body
+
+    def index(self):
+        links = "".join(
+            f'<li><a href="{urllib.parse.quote(name)}">{html.escape(name)}'
+            "</a></li>\n"
+            for name in sorted(self.pages)
+        )
+        return (
+            "<!DOCTYPE html>\n<title>MarkPlates</title>\n"
+            f"<ul>\n{links}</ul>\n"
+        ).encode("utf-8")
+
+    def serve_forever(self, poll_interval=0.5):
+        try:
+            self.httpd.serve_forever(poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.httpd.server_close()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _respond(self, send_body):
+        preview = self.server.preview
+        name = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        name = name.lstrip("/")
+        if not name:
+            self._send(200, "text/html", preview.index(), send_body)
+            return
+        template = preview.pages.get(name)
+        if template is None:
+            self._send(404, "text/plain", b"Not found\n", send_body)
+            return
+
+        try:
+            status, etag, body = preview.page(
+                template, self.headers.get("If-None-Match")
+            )
+        except (Exception, SystemExit) as e:
+            message = f"Failed to render {template}: {e}\n"
+            self._send(500, "text/plain", message.encode("utf-8"), send_body)
+            return
+        self._send(status, "text/plain", body, send_body, etag)
+
+    def _send(self, status, content_type, body, send_body, etag=None):
+        self.send_response(status)
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        if status != 304:
+            self.send_header("Content-Type", content_type + "; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body and status != 304:
+            self.wfile.write(body)
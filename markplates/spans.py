@@ -0,0 +1,126 @@
+""" Find the source text of ast nodes from the positions the parser records on
+them.
+
+asttokens works this out by tokenizing the whole file, which is by far the
+slowest part of import_function. Since Python 3.8 every node carries its start
+and end positions, which is enough almost every time. The spans found here are
+the same as asttokens' get_text_range(); where that can't be guaranteed
+Unsupported is raised so the caller can ask asttokens instead.
+"""
+import ast
+import itertools
+import sys
+import tokenize
+
+# end positions were added to the tree in 3.8
+SUPPORTED = sys.version_info >= (3, 8)
+
+_STATEMENTS = (ast.stmt, ast.excepthandler)
+if hasattr(ast, "match_case"):
+    _STATEMENTS += (ast.match_case,)
+
+
+class Unsupported(Exception):
+    """ The span of a node can't be found without tokenizing. """
+
+
+def last_statement(node):
+    """ The innermost last statement of node, or node itself if it contains
+    no statements. Its end is where asttokens ends node, leaving out any
+    semicolon after it.
+    """
+    children = [
+        child
+        for child in ast.iter_child_nodes(node)
+        if isinstance(child, _STATEMENTS)
+    ]
+    if children:
+        return last_statement(children[-1])
+    return node
+
+
+class SourceSpans:
+    """ Converts the positions on the nodes parsed from text into (start,
+    end) offsets in text.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.lines = text.split("\n")
+        # the offset just past the end of each line, not counting its "\n"
+        self._ends = list(itertools.accumulate(map(len, self.lines)))
+
+    def _line_start(self, lineno):
+        index = lineno - 1
+        if index <= 0:
+            return 0
+        return min(self._ends[index - 1] + index, len(self.text))
+
+    def _column(self, lineno, utf8_column):
+        """ Positions in the tree count utf-8 bytes, not characters. """
+        line = self.lines[lineno - 1]
+        if line.isascii():
+            return min(utf8_column, len(line))
+        return len(line.encode("utf-8")[:utf8_column].decode("utf-8", "ignore"))
+
+    def _offset(self, lineno, utf8_column):
+        return min(
+            self._line_start(lineno) + self._column(lineno, utf8_column),
+            len(self.text),
+        )
+
+    def _has_block(self, node):
+        """ True if the body of node starts on a line of its own, in which
+        case asttokens includes the indentation in front of node.
+        """
+        body = getattr(node, "body", None)
+        if not isinstance(body, list) or not body:
+            return False
+        first = body[0]
+        column = self._column(first.lineno, first.col_offset)
+        if self.lines[first.lineno - 1][:column].strip():
+            return False  # on the same line as the colon
+        if first.lineno > 1 and self.lines[first.lineno - 2].endswith("\\"):
+            # a continued line, unless the backslash ends a comment
+            raise Unsupported("line continuation")
+        return True
+
+    def span(self, node):
+        """ The (start, end) offsets of node in text. Decorators are counted
+        as part of a function or class.
+        """
+        decorators = getattr(node, "decorator_list", None)
+        if decorators:
+            # always more than one line, so the indentation is included
+            start = self._line_start(decorators[0].lineno)
+        elif self._has_block(node):
+            start = self._line_start(node.lineno)
+        else:
+            start = self._offset(node.lineno, node.col_offset)
+        last = last_statement(node)
+        return start, self._offset(last.end_lineno, last.end_col_offset)
+
+    def first_token(self, node):
+        """ The text of the first token of node. """
+        lineno = node.lineno
+        line = self.lines[lineno - 1]
+        column = self._column(lineno, node.col_offset)
+        target = getattr(node, "targets", [None])[0]
+        if (
+            isinstance(target, ast.Name)
+            and (target.lineno, target.col_offset) == (lineno, node.col_offset)
+            and target.end_lineno == lineno
+        ):
+            # a plain name, not in brackets, is a token on its own
+            return line[column : self._column(lineno, target.end_col_offset)]
+
+        rest = itertools.chain(
+            [line[column:] + "\n"],
+            (line + "\n" for line in self.lines[lineno:]),
+        )
+        try:
+            for token in tokenize.generate_tokens(rest.__next__):
+                return token.string
+        except (tokenize.TokenError, SyntaxError):
+            pass
+        raise Unsupported("no token")
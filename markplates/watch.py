@@ -0,0 +1,266 @@
+""" Keep rendering templates as the files they use change.
+
+A WatchSession holds on to a Renderer, which keeps everything that is
+expensive to rebuild (jinja2 Environments, parsed sources and file lines), and
+remembers which files each template read, so that a change only re-renders
+the templates that use it.
+"""
+import ctypes
+import ctypes.util
+import os
+import pathlib
+import select
+import struct
+import sys
+import time
+
+from .__main__ import Renderer
+from .batch import output_path
+from .output import write_chunks
+
+# Amount of time to keep collecting events after the first one, so that an
+# editor saving several files at once only triggers one render.
+SETTLE_TIME = 0.05
+
+
+class PollingWatcher:
+    """ Notices changes by checking the mtime and size of each file. """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self._stats = {}
+
+    @staticmethod
+    def _stat(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def watch(self, paths):
+        """ Replace the set of watched files. """
+        self._stats = {
+            path: self._stats.get(path, self._stat(path)) for path in paths
+        }
+
+    def changes(self):
+        """ Return the watched files which changed since the last call. """
+        changed = set()
+        for path, old in self._stats.items():
+            new = self._stat(path)
+            if new != old:
+                self._stats[path] = new
+                changed.add(path)
+        return changed
+
+    def wait(self, timeout=None):
+        """ Block until at least one watched file changes, or timeout seconds
+        have passed, and return the set of changed files.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self.changes()
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """ Uses Linux inotify to be told about changes rather than polling. The
+    directories holding the files are watched so that editors which save by
+    writing a new file and renaming it are still noticed. Files in directories
+    inotify can't watch, because the limit on watches has been reached or the
+    directory can't be read, are polled instead.
+    """
+
+    _EVENT = struct.Struct("iIII")
+    _MASK = (
+        0x00000002  # IN_MODIFY
+        | 0x00000004  # IN_ATTRIB
+        | 0x00000008  # IN_CLOSE_WRITE
+        | 0x00000080  # IN_MOVED_TO
+        | 0x00000100  # IN_CREATE
+        | 0x00000200  # IN_DELETE
+    )
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or not libc_name:
+            raise OSError("inotify is not available")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._directories = {}  # watch descriptor -> directory
+        self._paths = set()
+        self._polling = PollingWatcher()
+
+    def watch(self, paths):
+        """ Replace the set of watched files. """
+        self._paths = set(paths)
+        watched = set(self._directories.values())
+        failed = set()
+        for directory in {os.path.dirname(path) for path in self._paths}:
+            if directory in watched:
+                continue
+            wd = self._add_watch(directory)
+            if wd >= 0:
+                self._directories[wd] = directory
+            else:
+                failed.add(directory)
+        self._polling.watch(
+            {path for path in self._paths if os.path.dirname(path) in failed}
+        )
+
+    def _add_watch(self, directory):
+        return self._libc.inotify_add_watch(
+            self._fd, os.fsencode(directory), self._MASK
+        )
+
+    def _read_events(self):
+        changed = set()
+        try:
+            data = os.read(self._fd, 1 << 16)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            wd, _, _, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            directory = self._directories.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if path in self._paths:
+                changed.add(path)
+        return changed
+
+    def wait(self, timeout=None):
+        """ Block until at least one watched file changes, or timeout seconds
+        have passed, and return the set of changed files.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        changed = set()
+        while not changed:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+            interval = self._polling.interval
+            if self._polling._stats and (
+                remaining is None or remaining > interval
+            ):
+                # wake up in time to check the polled files too
+                remaining = interval
+            ready, _, _ = select.select([self._fd], [], [], remaining)
+            if ready:
+                changed |= self._read_events()
+            changed |= self._polling.changes()
+            if not changed and deadline is not None:
+                if time.monotonic() >= deadline:
+                    return changed
+        # let a burst of saves settle before reporting them
+        while select.select([self._fd], [], [], SETTLE_TIME)[0]:
+            changed |= self._read_events()
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+def make_watcher(poll_interval=0.5):
+    """ An InotifyWatcher where the platform supports it, otherwise a
+    PollingWatcher.
+    """
+    try:
+        return InotifyWatcher()
+    except (OSError, AttributeError):
+        return PollingWatcher(poll_interval)
+
+
+class WatchSession:
+    """ Renders a set of templates and re-renders them as their inputs
+    change. With an output_dir each template is written to a file in it, and
+    with an output_file the single template is written to that file;
+    otherwise results are printed to stdout. The renderer keeps compiled
+    templates and parsed sources warm between renders.
+    """
+
+    def __init__(
+        self,
+        templates,
+        output_dir=None,
+        renderer=None,
+        out=None,
+        output_file=None,
+    ):
+        self.templates = [pathlib.Path(t) for t in templates]
+        if output_file is not None and len(self.templates) != 1:
+            raise ValueError("An output file needs a single template")
+        self.output_dir = output_dir
+        self.output_file = output_file
+        self.renderer = renderer if renderer is not None else Renderer()
+        self.out = out if out is not None else sys.stdout
+        self.dependencies = {}
+
+    def render(self, template):
+        """ Render a single template, noting what it read. Errors are
+        reported rather than raised so a typo doesn't end the session.
+        """
+        # the template itself is always a dependency, even if it won't load
+        dependencies = {str(template.resolve())}
+        try:
+            text = self.renderer.render(template, dependencies)
+        except (Exception, SystemExit) as e:
+            print(f"Failed to render {template}: {e}", file=sys.stderr)
+            # keep watching what it used before so fixing it gets noticed
+            dependencies |= self.dependencies.get(template, set())
+        else:
+            if self.output_file is not None or self.output_dir:
+                if self.output_file is not None:
+                    output = pathlib.Path(self.output_file)
+                else:
+                    output = output_path(template, self.output_dir)
+                output.parent.mkdir(parents=True, exist_ok=True)
+                write_chunks(output, [text])
+            else:
+                print(text, file=self.out)
+                self.out.flush()
+        self.dependencies[template] = dependencies
+
+    def affected(self, changed):
+        """ The templates which read any of the changed files. """
+        changed = set(changed)
+        return [
+            template
+            for template in self.templates
+            if self.dependencies.get(template, set()) & changed
+        ]
+
+    def watched_files(self):
+        return set().union(*self.dependencies.values())
+
+    def render_all(self):
+        for template in self.templates:
+            self.render(template)
+
+    def run(self, watcher=None):
+        """ Render everything and then keep re-rendering until interrupted. """
+        watcher = watcher if watcher is not None else make_watcher()
+        try:
+            self.render_all()
+            while True:
+                watcher.watch(self.watched_files())
+                for template in self.affected(watcher.wait()):
+                    self.render(template)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
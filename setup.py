@@ -18,13 +18,13 @@ setup(
     url="https://github.com/jima80525/markplates",
     author="Jim Anderson",
     author_email="jima.coding@gmail.com",
-    python_requires=">=3.6.0",
+    python_requires=">=3.9.0",
     license="MIT",
     classifiers=[
         "License :: OSI Approved :: MIT License",
         "Programming Language :: Python",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.9",
     ],
     packages=[NAME],
     include_package_data=False,
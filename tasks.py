@@ -22,6 +22,20 @@ def test(c):
     )
 
 
+@task
+def bench(c, quick=False, output="", compare=""):
+    """ Run the benchmark suite. -q small workloads only, -o results file,
+        -c results file to compare against. """
+    args = " --quick" if quick else ""
+    if compare and not output:
+        output = "benchmarks/latest.json"
+    if output:
+        args += f" -o {output}"
+    run(f"{sys.executable} benchmarks/suite.py{args}")
+    if compare:
+        run(f"{sys.executable} benchmarks/compare.py {compare} {output}")
+
+
 @task
 def tox(c):
     """ Run tox to test all supported Python versions. """
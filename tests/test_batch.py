@@ -0,0 +1,105 @@
+import click.testing
+import markplates
+from markplates import batch
+from pathlib import Path
+
+
+def make_templates(tmp_path, count):
+    source = Path(__file__).resolve().parent / "data/source.py"
+    templates = []
+    for index in range(count):
+        template = tmp_path / f"article{index}.mdt"
+        template.write_text(
+            'Article %d\n{{ set_path("%s") }}{{ import_function("%s", "area") }}'
+            % (index, source.parent, source.name)
+        )
+        templates.append(template)
+    return templates
+
+
+def test_expand_templates(tmp_path):
+    make_templates(tmp_path, 3)
+    pattern = str(tmp_path / "*.mdt")
+    templates = batch.expand_templates([pattern, str(tmp_path / "extra.mdt")])
+    assert [t.name for t in templates] == [
+        "article0.mdt",
+        "article1.mdt",
+        "article2.mdt",
+        "extra.mdt",
+    ]
+
+    # patterns that don't match are kept so the error can be reported
+    missing = str(tmp_path / "nothing*.mdt")
+    assert batch.expand_templates([missing]) == [Path(missing)]
+
+
+def test_render_batch(tmp_path):
+    templates = make_templates(tmp_path, 3)
+    out_dir = tmp_path / "out"
+    written = batch.render_batch(templates, out_dir)
+    assert [w.name for w in written] == [
+        "article0.md",
+        "article1.md",
+        "article2.md",
+    ]
+    for index, template in enumerate(templates):
+        expected = markplates.process_template(template, False) + "\n"
+        assert (out_dir / f"article{index}.md").read_text() == expected
+
+    # renderers used in this process aren't kept after the batch
+    renderer = markplates.Renderer()
+    batch.render_batch(templates, out_dir, renderer, force=True)
+    batch.render_file(templates[0], tmp_path / "one.md", renderer)
+    assert renderer.id not in batch._worker_renderers
+
+
+def test_render_batch_pool(tmp_path):
+    templates = make_templates(tmp_path, 4)
+    out_dir = tmp_path / "out"
+    batch.render_batch(templates, out_dir, jobs=2)
+    for index in range(4):
+        assert (
+            (out_dir / f"article{index}.md")
+            .read_text()
+            .startswith(f"Article {index}\n")
+        )
+
+
+def test_batch_from_main(tmp_path):
+    make_templates(tmp_path, 2)
+    out_dir = tmp_path / "out"
+    runner = click.testing.CliRunner()
+    result = runner.invoke(
+        markplates.main,
+        ["-j", "2", "-o", str(out_dir), str(tmp_path / "*.mdt")],
+    )
+    assert result.exit_code == 0
+    assert sorted(p.name for p in out_dir.glob("*.md")) == [
+        "article0.md",
+        "article1.md",
+    ]
+
+    # many templates need somewhere to go
+    result = runner.invoke(markplates.main, [str(tmp_path / "*.mdt")])
+    assert result.exit_code == 2
+
+
+def test_output_file(tmp_path):
+    template = make_templates(tmp_path, 1)[0]
+    assert batch.is_file_output(tmp_path / "new.md", [template])
+    assert not batch.is_file_output(tmp_path / "new", [template])
+    assert not batch.is_file_output(tmp_path, [template])
+    assert not batch.is_file_output(tmp_path / "new.md", [template, template])
+
+    output = tmp_path / "docs" / "article.md"
+    runner = click.testing.CliRunner()
+    args = ["-v", "-o", str(output), str(template)]
+    result = runner.invoke(markplates.main, args)
+    assert result.exit_code == 0
+    assert f"Wrote {output}" in result.output
+    assert output.read_text() == markplates.process_template(template, 0) + "\n"
+
+    # nothing to do the second time, even when forced
+    result = runner.invoke(markplates.main, ["-f"] + args)
+    assert result.exit_code == 0
+    assert "Wrote" not in result.output
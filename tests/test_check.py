@@ -0,0 +1,92 @@
+import click.testing
+import markplates
+from markplates import Renderer
+from markplates import check
+from markplates.output import matches
+
+
+ARTICLE = '# Title\n{{ set_path("{path}") }}{{ import_source("source.py") }}'
+SOURCES = {"source.py": "# header\nvalue = 1\n"}
+
+
+def test_matches_stops_at_first_difference(tmp_path):
+    path = tmp_path / "out.md"
+    path.write_text("one\ntwo\n")
+
+    def chunks(*pieces):
+        yield from pieces
+        raise AssertionError("read past the difference")
+
+    assert matches(path, iter(["one\n", "two"]))
+    assert not matches(path, iter(["one\n", "tw"]))
+    assert not matches(path, iter(["one\n", "two\n"]))
+    assert not matches(path, chunks("one\n", "TWO"))
+    assert not matches(tmp_path / "missing.md", iter(["one"]))
+
+
+def test_matches_compares_bytes(tmp_path):
+    from markplates.output import write_chunks
+
+    # a file with other line endings isn't what would be written
+    path = tmp_path / "out.md"
+    path.write_bytes(b"a\r\nb\n")
+    assert not matches(path, ["a\nb"])
+    assert write_chunks(path, ["a\nb"])
+    assert matches(path, ["a\nb"])
+    assert not write_chunks(path, ["a\nb"])
+
+
+def test_check_single(tmp_path, make_article, bump):
+    template = make_article(ARTICLE, sources=SOURCES)
+    expected = tmp_path / "article.md"
+    expected.write_text(Renderer().render(template) + "\n")
+
+    runner = click.testing.CliRunner()
+    args = ["--check", str(template), str(expected)]
+    assert runner.invoke(markplates.main, args).exit_code == 0
+
+    bump(tmp_path / "source.py", "# header\nvalue = 2\n")
+    result = runner.invoke(markplates.main, args)
+    assert result.exit_code == 1
+    assert f"Out of date: {expected}" in result.output
+    # nothing is written
+    assert "value = 1" in expected.read_text()
+
+    result = runner.invoke(markplates.main, ["--check", str(template)])
+    assert result.exit_code == 2
+
+
+def test_check_batch_uses_manifest(tmp_path, monkeypatch, make_article, bump):
+    templates = [
+        make_article(ARTICLE, f"a{n}.mdt", SOURCES) for n in range(3)
+    ]
+    out_dir = tmp_path / "out"
+    runner = click.testing.CliRunner()
+    patterns = [str(t) for t in templates]
+    result = runner.invoke(markplates.main, ["-o", str(out_dir)] + patterns)
+    assert result.exit_code == 0
+
+    renders = []
+    original = Renderer.generate
+
+    def generate(self, template, *args, **kwargs):
+        renders.append(template.name)
+        return original(self, template, *args, **kwargs)
+
+    monkeypatch.setattr(Renderer, "generate", generate)
+    check_args = ["--check", "-o", str(out_dir)] + patterns
+    assert runner.invoke(markplates.main, check_args).exit_code == 0
+    assert renders == []
+
+    # an edited output is caught even though its inputs haven't changed
+    bump(out_dir / "a1.md", "edited\n")
+    result = runner.invoke(markplates.main, check_args)
+    assert result.exit_code == 1
+    assert renders == ["a1.mdt"]
+    assert "a1.md" in result.output and "a0.md" not in result.output
+
+    # without a manifest every template is rendered and compared
+    renders.clear()
+    stale = check.check_batch(templates, out_dir)
+    assert stale == [out_dir / "a1.md"]
+    assert renders == ["a0.mdt", "a1.mdt", "a2.mdt"]
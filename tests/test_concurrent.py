@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+
+import markplates
+from markplates import SourceCache
+
+
+def make_sources(tmp_path):
+    one = tmp_path / "one"
+    two = tmp_path / "two"
+    for directory in [one, two]:
+        directory.mkdir()
+        (directory / "code.py").write_text(
+            "# %s\ndef name():\n    return %r\n\n\nx = 1\n"
+            % (directory.name, directory.name)
+        )
+    return one, two
+
+
+def test_matches_sequential(tmp_path):
+    one, two = make_sources(tmp_path)
+    template = tmp_path / "article.mdt"
+    template.write_text(
+        '{{ set_path("%s") }}{{ import_source("code.py") }}\n'
+        '{{ import_function("code.py", "name", "python") }}\n'
+        '{{ set_path("%s", True) }}{{ import_source("code.py", [2, 6]) }}\n'
+        '{{ import_functions("code.py", ["x", "name"]) }}\n'
+        "&&&& for path in ['%s', '%s'] &&&&"
+        "{{ set_path(path) }}{{ import_function('code.py', 'name') }}\n"
+        "&&&& endfor &&&&"
+        '&&&& if import_source("code.py", [6]) == "x = 1" &&&&'
+        "{{ import_source('code.py', [1]) | upper }}\n"
+        "&&&& endif &&&&"
+        '{{ import_repl(">>> 1 + 1") }}\n' % (one, two, two, one)
+    )
+    sequential = markplates.process_template(template, False)
+    assert "'two'" in sequential and "# ONE" in sequential
+
+    dependencies = set()
+    text = markplates.process_template(
+        template, False, dependencies=dependencies, concurrent=True
+    )
+    assert text == sequential
+    assert str((one / "code.py").resolve()) in dependencies
+    assert str((two / "code.py").resolve()) in dependencies
+
+
+def test_directives_overlap(tmp_path, monkeypatch):
+    one, two = make_sources(tmp_path)
+    three = tmp_path / "three.py"
+    three.write_text("\nthree\n")
+    template = tmp_path / "article.mdt"
+    template.write_text(
+        '{{ import_source("%s") }}\n{{ import_source("%s") }}\n'
+        '{{ import_source("%s") }}'
+        % (one / "code.py", two / "code.py", three)
+    )
+    # each read waits until all three are being read at once
+    barrier = threading.Barrier(3, timeout=10)
+    original = SourceCache.read_lines
+
+    def read_lines(self, source):
+        barrier.wait()
+        return original(self, source)
+
+    monkeypatch.setattr(SourceCache, "read_lines", read_lines)
+    text = markplates.Renderer(concurrent=True, prefetch=False).render(
+        template
+    )
+    assert text.endswith("three")
+
+
+def test_repl_blocks_run_in_order(tmp_path, monkeypatch):
+    from markplates import repl
+
+    template = tmp_path / "article.mdt"
+    template.write_text(
+        "{{ import_repl(\"import os; os.environ['MP_ORDER'] = '1'\") }}\n"
+        "{{ import_repl(\"import os\\nos.environ['MP_ORDER']\") }}"
+    )
+    # without a ReplPool the blocks run in the render itself, one after
+    # another, as they share the process
+    ran = []
+    original = repl.run_repl
+
+    def run_repl(source):
+        ran.append((source, threading.current_thread()))
+        return original(source)
+
+    monkeypatch.setattr(repl, "run_repl", run_repl)
+    monkeypatch.delenv("MP_ORDER", raising=False)
+    text = markplates.process_template(template, False, concurrent=True)
+    assert text.endswith(">>> os.environ['MP_ORDER']\n'1'")
+    assert [thread for _, thread in ran] == [threading.current_thread()] * 2
+    monkeypatch.delenv("MP_ORDER", raising=False)
+
+
+def test_errors_are_raised(tmp_path):
+    template = tmp_path / "article.mdt"
+    template.write_text(
+        '{{ set_path("%s") }}{{ import_source("missing.py") }}' % tmp_path
+    )
+    with pytest.raises(FileNotFoundError):
+        markplates.process_template(template, False, concurrent=True)
+
+
+def test_cli(tmp_path):
+    import click.testing
+
+    one, two = make_sources(tmp_path)
+    template = tmp_path / "article.mdt"
+    template.write_text(
+        '{{ set_path("%s") }}{{ import_function("code.py", "name") }}' % one
+    )
+    runner = click.testing.CliRunner()
+    result = runner.invoke(markplates.main, ["--concurrent", str(template)])
+    assert result.exit_code == 0
+    assert result.output == "def name():\n    return 'one'\n"
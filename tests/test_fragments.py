@@ -0,0 +1,122 @@
+import os
+import click.testing
+import markplates
+from markplates.fragments import FragmentCache
+
+
+def test_get_and_put(tmp_path):
+    cache = FragmentCache(tmp_path / "cache")
+    key = cache.key("import_repl", "print(1)")
+    assert key == cache.key("import_repl", "print(1)")
+    assert key != cache.key("import_repl", "print(2)")
+
+    assert cache.get(key) is None
+    cache.put(key, "fragment\n")
+    assert cache.get(key) == "fragment\n"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # another instance, as in a later run, sees the same data
+    assert FragmentCache(tmp_path / "cache").get(key) == "fragment\n"
+
+    cache.clear()
+    assert cache.get(key) is None
+
+
+def test_clear_keeps_other_files(tmp_path):
+    # the cache may have been pointed at a directory holding other things
+    (tmp_path / "article.mdt").write_text("keep")
+    (tmp_path / "ab").mkdir()
+    (tmp_path / "ab" / "notes.txt").write_text("keep")
+    cache = FragmentCache(tmp_path)
+    key = cache.key("import_repl", "print(1)")
+    cache.put(key, "fragment\n")
+
+    cache.clear()
+    assert cache.get(key) is None
+    assert not (tmp_path / key[:2]).exists()
+    assert (tmp_path / "article.mdt").read_text() == "keep"
+    assert (tmp_path / "ab" / "notes.txt").read_text() == "keep"
+
+
+def test_eviction(tmp_path):
+    cache = FragmentCache(tmp_path, max_bytes=100)
+    keys = [cache.key(index) for index in range(4)]
+    for age, key in enumerate(keys[:3]):
+        cache.put(key, "x" * 30)
+        # make the earlier writes clearly older
+        path = tmp_path / key[:2] / key
+        os.utime(path, ns=(age * 10 ** 9, age * 10 ** 9))
+
+    # going over the limit removes the least recently used
+    cache.put(keys[3], "x" * 30)
+    present = [cache.get(key) is not None for key in keys]
+    assert present == [False, False, True, True]
+
+
+def test_directives_use_cache(tmp_path):
+    source = tmp_path / "source.py"
+    source.write_text("def area(w, h):\n    return w * h\n")
+    template = tmp_path / "article.mdt"
+    template.write_text(
+        '{{ set_path("%s") }}'
+        '{{ import_source("source.py", ["1-$"]) }}\n'
+        '{{ import_function("source.py", "area") }}\n'
+        '{{ import_repl("print(6 * 7)") }}' % tmp_path
+    )
+    first = FragmentCache(tmp_path / "cache")
+    expected = markplates.process_template(template, False)
+    assert (
+        markplates.process_template(template, False, fragment_cache=first)
+        == expected
+    )
+    assert (first.hits, first.misses) == (0, 3)
+
+    second = FragmentCache(tmp_path / "cache")
+    assert (
+        markplates.process_template(template, False, fragment_cache=second)
+        == expected
+    )
+    assert (second.hits, second.misses) == (3, 0)
+
+    # changing the source file invalidates the fragments that use it
+    source.write_text("def area(w, h):\n    return h * w\n")
+    third = FragmentCache(tmp_path / "cache")
+    result = markplates.process_template(template, False, fragment_cache=third)
+    assert "h * w" in result
+    assert (third.hits, third.misses) == (1, 2)
+
+
+def test_cache_options(tmp_path):
+    template = tmp_path / "article.mdt"
+    template.write_text('{{ import_repl("print(6 * 7)") }}')
+    cache_dir = tmp_path / "cache"
+    runner = click.testing.CliRunner()
+    result = runner.invoke(
+        markplates.main, ["--cache-dir", str(cache_dir), str(template)]
+    )
+    assert result.exit_code == 0
+    assert result.output == ">>> print(6 * 7)\n42\n"
+    assert list(cache_dir.glob("fragments/??/*"))
+    assert list(cache_dir.glob("bytecode/*"))
+
+    result = runner.invoke(
+        markplates.main, ["--cache-dir", str(cache_dir), "--clear-cache"]
+    )
+    assert result.exit_code == 0
+    assert not list(cache_dir.glob("fragments/??/*"))
+    assert not (cache_dir / "bytecode").exists()
+    # only the directories markplates writes are removed
+    assert template.exists()
+    result = runner.invoke(
+        markplates.main, ["--cache-dir", str(tmp_path), "--clear-cache"]
+    )
+    assert result.exit_code == 0
+    assert template.exists()
+
+    result = runner.invoke(markplates.main, [])
+    assert result.exit_code == 2
+
+    # there's no default cache directory to clear
+    result = runner.invoke(markplates.main, ["--clear-cache"])
+    assert result.exit_code == 2
+    assert "--cache-dir" in result.output
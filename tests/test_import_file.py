@@ -169,3 +169,20 @@ def test_add_filename_and_language(tmp_path):
     expected_result = "\n".join(expected_result)
     fred = process(tmp_path, lines, "Python", True)
     assert fred == expected_result
+
+
+def test_blank_line_whitespace(tmp_path):
+    # blank lines keep their own whitespace while the others are justified,
+    # and trailing lines of spaces are dropped
+    lines = ["    1", "  ", "      2", "\t", "", "    3", "   ", " "]
+    expected_result = ["1", "  ", "  2", "\t", "3"]
+    expected_result.insert(0, "```python")
+    expected_result.append("```")
+    expected_result = "\n".join(expected_result)
+    fred = process(tmp_path, lines, "python")
+    assert fred == expected_result
+
+    # a last line of tabs isn't a line of spaces, but is still stripped
+    lines = ["  1", "  2", "\t"]
+    fred = process(tmp_path, lines)
+    assert fred == "1\n2"
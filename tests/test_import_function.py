@@ -66,3 +66,65 @@ def test_add_language(tmp_path):
     )
     fred = markplates.process_template(template, False)
     assert fred == expected
+
+
+def test_import_functions(tmp_path):
+    source_file, source = __load_source()
+    area = "".join(source[9:12]).rstrip()
+    method = "".join(line[4:] for line in source[4:7]).rstrip()
+
+    template = tmp_path / "t_import.mdt"
+    template.write_text(
+        '{{ set_path("%s") }}{{ import_functions("%s", ["area", "Square.area"]) }}'
+        % (source_file.parent, source_file.name)
+    )
+    assert (
+        markplates.process_template(template, False) == area + "\n\n" + method
+    )
+
+    # as a list, each in its own block
+    template.write_text(
+        '{{ set_path("%s") }}'
+        '&&&& for code in import_functions("%s", ["Square.area", "area"], '
+        '"python", separator=None) &&&&'
+        "{{ code }}\n&&&& endfor &&&&" % (source_file.parent, source_file.name)
+    )
+    expected = "```python\n%s\n```\n```python\n%s\n```\n" % (method, area)
+    assert markplates.process_template(template, False) == expected
+
+    template.write_text(
+        '{{ set_path("%s") }}{{ import_functions("%s", ["area", "nope"]) }}'
+        % (source_file.parent, source_file.name)
+    )
+    with pytest.raises(Exception, match="nope"):
+        markplates.process_template(template, False)
+
+
+def test_import_functions_parses_once(tmp_path):
+    source_file, source = __load_source()
+    cache = markplates.SourceCache()
+    template = tmp_path / "t_import.mdt"
+    template.write_text(
+        '{{ set_path("%s") }}'
+        '{{ import_functions("%s", ["area", "Square", "my_squares"]) }}'
+        % (source_file.parent, source_file.name)
+    )
+    markplates.process_template(template, False, cache, prefetch=False)
+    assert cache.misses == 1
+    assert cache.hits == 0
+
+
+def test_import_func_fast(tmp_path):
+    source_file, source = __load_source()
+    template = tmp_path / "t_import.mdt"
+    for name in ["area", "Square.area", "my_squares"]:
+        template.write_text(
+            '{{ set_path("%s") }}{{ import_function("%s", "%s", fast=True) }}'
+            % (source_file.parent, source_file.name, name)
+        )
+        fast = markplates.process_template(template, False)
+        template.write_text(
+            '{{ set_path("%s") }}{{ import_function("%s", "%s") }}'
+            % (source_file.parent, source_file.name, name)
+        )
+        assert fast == markplates.process_template(template, False)
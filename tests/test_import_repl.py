@@ -47,3 +47,60 @@ def test_function_format(tmp_path):
         temp.write("after\n")
     result = markplates.process_template(template, False)
     assert result == expected_result
+
+
+SESSION_TEMPLATE = (
+    '{{ import_repl("x = 1", session="a") }}\n'
+    '{{ import_repl("y = 10", "b") }}\n'
+    '{{ import_repl("x += 1\\nx", session="a") }}\n'
+    '{{ import_repl("y", session="b") }}\n'
+    '{{ reset_repl("a") }}'
+    '{{ import_repl("x", session="a") }}'
+)
+
+
+def test_sessions(tmp_path):
+    template = tmp_path / "t_import.mdt"
+    template.write_text(SESSION_TEMPLATE)
+    result = markplates.process_template(template, False)
+    lines = result.split("\n")
+    assert lines[:5] == [">>> x = 1", ">>> y = 10", ">>> x += 1", ">>> x", "2"]
+    assert lines[5:7] == [">>> y", "10"]
+    assert "NameError" in result.split(">>> x\n")[-1]
+    # each render starts afresh
+    assert markplates.process_template(template, False) == result
+    assert result == markplates.process_template(
+        template, False, concurrent=True
+    )
+
+
+def test_session_fragment_cache(tmp_path):
+    from markplates.fragments import FragmentCache
+
+    template = tmp_path / "t_import.mdt"
+    template.write_text(
+        '{{ import_repl("x = 1", session="s") }}\n'
+        '{{ import_repl("x + 1", session="s") }}'
+    )
+    cache = FragmentCache(tmp_path / "cache")
+    first = markplates.process_template(template, False, fragment_cache=cache)
+    assert first.endswith(">>> x + 1\n2")
+
+    # the unchanged first block comes from the cache but still runs before
+    # the changed one
+    template.write_text(
+        '{{ import_repl("x = 1", session="s") }}\n'
+        '{{ import_repl("x + 2", session="s") }}'
+    )
+    cache.hits = cache.misses = 0
+    result = markplates.process_template(template, False, fragment_cache=cache)
+    assert result.endswith(">>> x + 2\n3")
+    assert cache.hits == 1 and cache.misses == 1
+
+    # a cached block isn't used when a block before it changed
+    template.write_text(
+        '{{ import_repl("x = 5", session="s") }}\n'
+        '{{ import_repl("x + 2", session="s") }}'
+    )
+    result = markplates.process_template(template, False, fragment_cache=cache)
+    assert result.endswith(">>> x + 2\n7")
@@ -0,0 +1,80 @@
+import markplates
+import tracemalloc
+from markplates import SourceCache
+from markplates.lines import LineIndex
+
+
+def check_matches(path, step):
+    with open(path) as f:
+        expected = f.readlines()
+    index = LineIndex(path, step=step)
+    assert len(index) == len(expected)
+    assert list(index) == expected
+    assert index[:] == expected
+    assert index[2:7] == expected[2:7]
+    assert index[-1:] == expected[-1:]
+    if expected:
+        assert index[-1] == expected[-1]
+        assert index[len(expected) // 2] == expected[len(expected) // 2]
+
+
+def test_matches_readlines(tmp_path):
+    path = tmp_path / "lines.txt"
+    contents = [
+        "",
+        "one line no newline",
+        "".join(f"line {n}\n" for n in range(50)),
+        "".join(f"line {n}\n" for n in range(50)) + "no newline",
+        "windows\r\nline endings\r\n",
+        "\n\n\nblank\n\n",
+        "a\rb\rc\n",
+        "mixed\r\r\n\rendings\r",
+    ]
+    for text in contents:
+        path.write_bytes(text.encode())
+        for step in [1, 3, 256]:
+            check_matches(path, step)
+
+
+def import_source(tmp_path, ranges, show_skipped=False):
+    template = tmp_path / "t_import.mdt"
+    template.write_text(
+        '{{ set_path("%s", %s) }}{{ import_source("big.py", %s) }}'
+        % (tmp_path, show_skipped, ranges)
+    )
+    return markplates.process_template(template, False, SourceCache())
+
+
+def test_import_source_uses_index(tmp_path, monkeypatch):
+    big = tmp_path / "big.py"
+    big.write_text("".join(f"    line{n} = {n}\n" for n in range(2000)))
+
+    cases = [
+        (["10-20"], False),
+        (["$"], False),
+        (["$-5"], False),
+        ([3, "1900-$", "100-120"], False),
+        ([3, "1900-$", "100-120"], True),
+        (None, False),
+    ]
+    expected = [import_source(tmp_path, *case) for case in cases]
+
+    monkeypatch.setattr(SourceCache, "large_file_size", 0)
+    assert [import_source(tmp_path, *case) for case in cases] == expected
+
+
+def test_memory_tracks_snippet(tmp_path, monkeypatch):
+    big = tmp_path / "big.py"
+    with open(big, "w") as f:
+        for n in range(200000):
+            f.write(f"value_{n} = {n} * {n}\n")
+    monkeypatch.setattr(SourceCache, "large_file_size", 0)
+
+    tracemalloc.start()
+    try:
+        result = import_source(tmp_path, ["150000-150010"])
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert result.startswith("value_149999 = 149999 * 149999")
+    assert peak < big.stat().st_size // 10
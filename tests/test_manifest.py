@@ -0,0 +1,83 @@
+import os
+from markplates import Renderer
+from markplates import batch
+from markplates.manifest import Manifest
+
+
+def make_template(tmp_path):
+    source = tmp_path / "source.py"
+    source.write_text("def area(w, h):\n    return w * h\n")
+    template = tmp_path / "article.mdt"
+    template.write_text(
+        '{{ set_path("%s") }}{{ import_function("source.py", "area") }}'
+        % tmp_path
+    )
+    return template, source
+
+
+def test_unchanged_inputs_are_skipped(tmp_path):
+    template, source = make_template(tmp_path)
+    out_dir = tmp_path / "out"
+    manifest_file = out_dir / "manifest.json"
+
+    written = batch.render_batch(
+        [template], out_dir, manifest=Manifest(manifest_file)
+    )
+    assert len(written) == 1
+
+    manifest = Manifest(manifest_file)
+    assert batch.render_batch([template], out_dir, manifest=manifest) == []
+    # forcing renders even though nothing changed, but an identical output
+    # isn't rewritten
+    output = out_dir / "article.md"
+    mtime = output.stat().st_mtime_ns
+    written = batch.render_batch(
+        [template], out_dir, manifest=manifest, force=True
+    )
+    assert written == []
+    assert output.stat().st_mtime_ns == mtime
+
+    # a different option is a different build
+    written = batch.render_batch(
+        [template],
+        out_dir,
+        Renderer(square=True),
+        manifest=Manifest(manifest_file),
+    )
+    assert len(written) == 1
+
+
+def test_changed_inputs_are_rendered(tmp_path):
+    template, source = make_template(tmp_path)
+    out_dir = tmp_path / "out"
+    manifest_file = out_dir / "manifest.json"
+    batch.render_batch([template], out_dir, manifest=Manifest(manifest_file))
+
+    source.write_text("def area(w, h):\n    return h * w\n")
+    written = batch.render_batch(
+        [template], out_dir, manifest=Manifest(manifest_file)
+    )
+    assert len(written) == 1
+    assert "h * w" in (out_dir / "article.md").read_text()
+
+    # removing the output forces it to be rebuilt
+    (out_dir / "article.md").unlink()
+    written = batch.render_batch(
+        [template], out_dir, manifest=Manifest(manifest_file)
+    )
+    assert len(written) == 1
+
+
+def test_touched_but_identical(tmp_path):
+    template, source = make_template(tmp_path)
+    manifest = Manifest(tmp_path / "manifest.json")
+    output = tmp_path / "article.md"
+    output.write_text("")
+    manifest.record(template, output, {}, {str(source.resolve())})
+
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert manifest.is_current(template, output, {})
+
+    source.write_text("x = 1\n")
+    assert not manifest.is_current(template, output, {})
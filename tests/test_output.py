@@ -0,0 +1,68 @@
+import os
+import markplates
+import pytest
+from markplates.__main__ import _SkipLines
+from markplates.__main__ import generate_template
+from markplates.output import write_chunks
+
+
+def test_generate_matches_process(tmp_path):
+    source = tmp_path / "source.py"
+    source.write_text("".join(f"line_{n} = {n}\n" for n in range(100)))
+    template = tmp_path / "article.mdt"
+    template.write_text(
+        "# Title\n\n"
+        '{{ set_path("%s") }}intro\n'
+        '{{ import_source("source.py", ["1-50"]) }}\n'
+        "middle\n"
+        '{{ import_source("source.py", ["51-$"]) }}\n' % tmp_path
+    )
+    chunks = list(generate_template(template, False))
+    assert len(chunks) > 1
+    assert "".join(chunks) == markplates.process_template(template, False)
+
+
+def test_skip_lines():
+    for pieces in [
+        ["# Title\n\nbody\nmore"],
+        ["# Ti", "tle", "\n", "\nbo", "dy\nmore"],
+        ["# Title\n", "\n", "body\n", "more"],
+    ]:
+        skipped = _SkipLines(2)
+        for piece in pieces:
+            skipped.write(piece)
+        assert skipped.kept.getvalue() == "body\nmore"
+
+    skipped = _SkipLines(2)
+    skipped.write("only one line\n")
+    assert skipped.kept.getvalue() == ""
+
+
+def test_write_chunks(tmp_path):
+    output = tmp_path / "out.md"
+    write_chunks(output, ["a", "b"])
+    assert output.read_text() == "ab\n"
+
+    def failing():
+        yield "partial"
+        raise RuntimeError("render failed")
+
+    with pytest.raises(RuntimeError):
+        write_chunks(output, failing())
+    # the earlier output is left alone and no temporary files remain
+    assert output.read_text() == "ab\n"
+    assert [p.name for p in tmp_path.iterdir()] == ["out.md"]
+
+
+def test_write_if_changed(tmp_path):
+    output = tmp_path / "out.md"
+    assert write_chunks(output, ["same"])
+    mtime = output.stat().st_mtime_ns - 10**9
+    os.utime(output, ns=(mtime, mtime))
+
+    assert not write_chunks(output, ["sa", "me"])
+    assert output.stat().st_mtime_ns == mtime
+    assert write_chunks(output, ["changed"])
+    assert output.read_text() == "changed\n"
+    assert output.stat().st_mtime_ns != mtime
+    assert [p.name for p in tmp_path.iterdir()] == ["out.md"]
@@ -0,0 +1,95 @@
+import json
+import click.testing
+import markplates
+from markplates import Renderer
+from markplates.profile import Profiler
+
+
+ARTICLE = (
+    "# Title\n"
+    '{{ set_path("{path}") }}\n'
+    "text\n"
+    '{{ import_source("source.py", ["2-3"]) }}\n'
+    "&&&& for n in range(3) &&&&\n"
+    '{{ import_function("source.py", "one") }}\n'
+    "&&&& endfor &&&&\n"
+)
+SOURCES = {"source.py": "# header\ndef one():\n    return 1\n\n\nx = 2\n"}
+
+
+def test_call_sites(tmp_path, make_article):
+    template = make_article(ARTICLE, sources=SOURCES)
+    profiler = Profiler()
+    renderer = Renderer(profiler=profiler)
+    profiled = renderer.render(template)
+    assert profiled == Renderer().render(template)
+
+    sites = {
+        (row["directive"], row["line"]): row
+        for row in profiler.rows()
+        if row["template"] == str(template)
+    }
+    check_sites(tmp_path, sites)
+    seconds = [row["seconds"] for row in profiler.rows()]
+    assert seconds == sorted(seconds, reverse=True)
+
+
+def check_sites(tmp_path, sites):
+    assert set(sites) == {
+        ("set_path", 2),
+        ("import_source", 4),
+        ("import_function", 6),
+    }
+    source_row = sites[("import_source", 4)]
+    assert source_row["calls"] == 1
+    assert source_row["lines"] == 2
+    assert source_row["bytes_read"] == (tmp_path / "source.py").stat().st_size
+    function_row = sites[("import_function", 6)]
+    assert function_row["calls"] == 3
+    assert function_row["lines"] == 6
+    # the file is only parsed on the first call
+    assert function_row["bytes_read"] == source_row["bytes_read"]
+    assert function_row["cache_hits"] == 2
+
+
+def test_concurrent_calls(tmp_path, make_article):
+    # each call is charged with its own reads, though they all run at once
+    # in other threads
+    template = make_article(ARTICLE, sources=SOURCES)
+    profiler = Profiler()
+    renderer = Renderer(profiler=profiler, concurrent=True)
+    assert renderer.render(template) == Renderer().render(template)
+    sites = {
+        (row["directive"], row["line"]): row
+        for row in profiler.rows()
+        if row["template"] == str(template)
+    }
+    check_sites(tmp_path, sites)
+
+
+def test_off_by_default(tmp_path, make_article):
+    template = make_article(ARTICLE, sources=SOURCES)
+    renderer = Renderer()
+    assert renderer.profiler is None
+    assert renderer.render(template)
+
+
+def test_cli_report(tmp_path, make_article):
+    template = make_article(ARTICLE, sources=SOURCES)
+    report = tmp_path / "profile.json"
+    runner = click.testing.CliRunner()
+    result = runner.invoke(
+        markplates.main,
+        ["--profile", "--profile-json", str(report), str(template)],
+    )
+    assert result.exit_code == 0
+    assert "import_function" in result.output
+    assert result.stdout.startswith(Renderer().render(template) + "\n")
+    rows = json.loads(report.read_text())
+    sites = {(row["directive"], row["line"]): row for row in rows}
+    assert set(sites) == {
+        ("set_path", 2),
+        ("import_source", 4),
+        ("import_function", 6),
+    }
+    check_sites(tmp_path, sites)
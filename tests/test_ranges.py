@@ -83,3 +83,39 @@ def test_ordering(counting_lines):
     ranges = ["2", "5-6", 2, "5-6", "6"]
     output_lines = markplates.condense_ranges(lines, ranges, "filename")
     assert output_lines == ["2\n", "5\n", "6\n"]
+
+
+def test_show_skipped(counting_lines):
+    lines = counting_lines()
+    # gaps of a single line are not marked
+    ranges = ["2-3", "5-6"]
+    output_lines = markplates.condense_ranges(
+        lines, ranges, "filename", show_skipped=True
+    )
+    assert output_lines == ["2\n", "3\n", "5\n", "6\n"]
+
+    ranges = ["2-3", "9-$"]
+    output_lines = markplates.condense_ranges(
+        lines, ranges, "filename", show_skipped=True
+    )
+    assert output_lines == [
+        "2\n",
+        "3\n",
+        "\n",
+        "# ...\n",
+        "\n",
+        "9\n",
+        "10\n",
+        "11\n",
+        "12\n",
+        "13\n",
+    ]
+
+
+def test_large_ranges():
+    lines = [str(x + 1) + "\n" for x in range(100000)]
+    ranges = ["1-$", "$-10", "50000-60000"]
+    output_lines = markplates.condense_ranges(
+        lines, ranges, "filename", show_skipped=True
+    )
+    assert output_lines == lines
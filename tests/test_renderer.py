@@ -0,0 +1,134 @@
+import markplates
+from markplates import Renderer
+from markplates.environment import _RecordingEnvironment
+
+
+ARTICLE = "# Title\n{{ 'body' }}\n"
+
+
+def count_compiles(monkeypatch):
+    calls = []
+    original = _RecordingEnvironment.compile
+
+    def compile(self, *args, **kwargs):
+        calls.append(args)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(_RecordingEnvironment, "compile", compile)
+    return calls
+
+
+def test_environment_reused(tmp_path, monkeypatch, make_article, bump):
+    compiles = count_compiles(monkeypatch)
+    template = make_article(ARTICLE)
+    other_dir = tmp_path / "other"
+    other_dir.mkdir()
+    other = make_article(ARTICLE, directory=other_dir)
+
+    renderer = Renderer()
+    for _ in range(3):
+        assert renderer.render(template) == "# Title\nbody"
+        assert renderer.render(other) == "# Title\nbody"
+    assert len(compiles) == 2
+    assert renderer.environment() is renderer.environment(False)
+    assert renderer.environment(True) is not renderer.environment(False)
+
+    # a changed template is compiled again
+    bump(template, "changed")
+    assert renderer.render(template) == "changed"
+    assert len(compiles) == 3
+
+
+def test_bytecode_cache(tmp_path, monkeypatch, make_article):
+    compiles = count_compiles(monkeypatch)
+    template = make_article(ARTICLE)
+    cache_dir = tmp_path / "bytecode"
+
+    assert Renderer(bytecode_cache_dir=cache_dir).render(template)
+    assert len(compiles) == 1
+    # a new renderer, as in the next run, loads the compiled template
+    assert Renderer(bytecode_cache_dir=cache_dir).render(template)
+    assert len(compiles) == 1
+
+
+def test_includes_relative_to_template(tmp_path):
+    sub = tmp_path / "sub"
+    sub.mkdir()
+    (sub / "part.mdt").write_text('part &&&& include "footer.mdt" &&&&')
+    (tmp_path / "footer.mdt").write_text("footer")
+    template = tmp_path / "article.mdt"
+    template.write_text('top &&&& include "sub/part.mdt" &&&&')
+
+    dependencies = set()
+    result = Renderer().render(template, dependencies)
+    assert result == "top part footer"
+    assert dependencies == {
+        str(template.resolve()),
+        str((sub / "part.mdt").resolve()),
+        str((tmp_path / "footer.mdt").resolve()),
+    }
+    assert markplates.process_template(template, False) == result
+
+
+def test_concurrent_renders(tmp_path):
+    import concurrent.futures
+
+    source = tmp_path / "source.py"
+    source.write_text("".join(f"line_{n} = {n}\n" for n in range(1, 30)))
+    templates = []
+    for n in range(12):
+        template = tmp_path / f"article_{n}.mdt"
+        template.write_text(
+            '{{ set_path("%s", %s) }}\n'
+            '{{ import_source("source.py", ["2-3", "%d-$"]) }}\n'
+            '{{ import_function("source.py", "line_%d") }}\n'
+            '{{ import_repl("x = %d\\nx * 2") }}\n'
+            % (tmp_path, n % 2 == 0, 10 + n, n + 1, n)
+        )
+        templates.append(template)
+
+    expected = [Renderer().render(template) for template in templates]
+    assert "# ..." in expected[0] and "# ..." not in expected[1]
+
+    renderer = Renderer()
+    with concurrent.futures.ThreadPoolExecutor(6) as pool:
+        for _ in range(3):
+            assert list(pool.map(renderer.render, templates)) == expected
+
+
+def test_interleaved_generators(tmp_path):
+    from markplates.environment import _template_root
+
+    templates = []
+    for name in ["a", "b"]:
+        directory = tmp_path / name
+        directory.mkdir()
+        (directory / "inc.mdt").write_text(f"{name.upper()}-inc")
+        template = directory / "t.mdt"
+        template.write_text(
+            'start\n&&&& include "inc.mdt" &&&&\n&&&& include "inc.mdt" &&&&'
+        )
+        templates.append(template)
+
+    # two renders consumed a piece at a time each, in the same thread
+    renderer = Renderer()
+    dependencies = [set(), set()]
+    chunks = [[], []]
+    streams = [
+        renderer.generate(template, found)
+        for template, found in zip(templates, dependencies)
+    ]
+    for pieces in zip(*streams):
+        for chunk, piece in zip(chunks, pieces):
+            chunk.append(piece)
+    for chunk, stream in zip(chunks, streams):
+        chunk.extend(stream)
+
+    assert "".join(chunks[0]) == "start\nA-inc\nA-inc"
+    assert "".join(chunks[1]) == "start\nB-inc\nB-inc"
+    for template, found in zip(templates, dependencies):
+        assert found == {
+            str(template.resolve()),
+            str((template.parent / "inc.mdt").resolve()),
+        }
+    assert _template_root.get() is None
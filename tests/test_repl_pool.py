@@ -0,0 +1,87 @@
+import markplates
+import pytest
+import time
+from markplates.repl import ReplPool
+from markplates.repl import run_repl
+
+BLOCKS = [
+    "\ndef func():\n    pass\n\npass\n",
+    "++++++",
+    "os.path()",
+    "\n\n\n\n",
+    "print('café')",
+]
+
+
+def test_matches_in_process():
+    pool = ReplPool(2)
+    try:
+        for block in BLOCKS:
+            assert pool.run(block) == run_repl(block)
+    finally:
+        pool.shutdown()
+
+
+def test_timeout():
+    pool = ReplPool(1, timeout=0.5)
+    try:
+        with pytest.raises(TimeoutError):
+            pool.run("import time\ntime.sleep(10)")
+        # the pool is still usable afterwards
+        assert pool.run("1 + 1") == ">>> 1 + 1\n2"
+    finally:
+        pool.shutdown()
+
+
+def test_blocks_run_concurrently(tmp_path):
+    template = tmp_path / "t_import.mdt"
+    template.write_text(
+        "".join(
+            '{{ import_repl("import time; time.sleep(1); print(%d)") }}\n' % i
+            for i in range(3)
+        )
+    )
+    pool = ReplPool(3)
+    try:
+        start = time.monotonic()
+        result = markplates.process_template(template, False, repl_pool=pool)
+        elapsed = time.monotonic() - start
+    finally:
+        pool.shutdown()
+    assert result == "\n".join(
+        ">>> import time; time.sleep(1); print(%d)\n%d" % (i, i)
+        for i in range(3)
+    )
+    assert elapsed < 2.5
+
+
+def test_blocks_are_isolated():
+    pool = ReplPool(1)
+    try:
+        pool.run("import sys; sys.marker = 1")
+        assert "AttributeError" in pool.run("import sys; sys.marker")
+    finally:
+        pool.shutdown()
+
+
+def test_memory_limit():
+    pytest.importorskip("resource")
+    pool = ReplPool(1, memory_limit=512 * 1024 * 1024)
+    try:
+        result = pool.run("x = bytearray(2 * 1024 ** 3)")
+    finally:
+        pool.shutdown()
+    assert "MemoryError" in result
+
+
+def test_timeout_must_be_positive(tmp_path):
+    import click.testing
+
+    template = tmp_path / "t_import.mdt"
+    template.write_text('{{ import_repl("1") }}')
+    runner = click.testing.CliRunner()
+    result = runner.invoke(
+        markplates.main, ["--repl-timeout", "0", str(template)]
+    )
+    assert result.exit_code == 2
+    assert "--repl-timeout" in result.output
@@ -0,0 +1,81 @@
+import os
+import threading
+import urllib.error
+import urllib.request
+import pytest
+from markplates import Renderer
+from markplates.serve import PreviewServer
+
+
+@pytest.fixture
+def serving(tmp_path):
+    source = tmp_path / "source.py"
+    source.write_text("# header\nvalue = 1\n")
+    template = tmp_path / "article.mdt"
+    template.write_text(
+        '# Title\n{{ set_path("%s") }}{{ import_source("source.py") }}'
+        % tmp_path
+    )
+    renders = []
+    renderer = Renderer()
+    original = renderer.render
+
+    def render(*args, **kwargs):
+        renders.append(args[0])
+        return original(*args, **kwargs)
+
+    renderer.render = render
+    server = PreviewServer([template], renderer, port=0)
+    thread = threading.Thread(
+        target=server.serve_forever, args=(0.01,), daemon=True
+    )
+    thread.start()
+    yield server, source, renders
+    server.shutdown()
+    thread.join()
+
+
+def get(server, path, etag=None):
+    request = urllib.request.Request(server.url + path)
+    if etag:
+        request.add_header("If-None-Match", etag)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def test_conditional_requests(serving):
+    server, source, renders = serving
+    status, headers, body = get(server, "article.md")
+    assert status == 200
+    assert body == b"# Title\nvalue = 1\n"
+    etag = headers["ETag"]
+
+    # unchanged inputs are neither rendered nor sent again
+    assert get(server, "article.md", etag)[0] == 304
+    assert get(server, "article.md")[2] == body
+    assert len(renders) == 1
+
+    old = source.stat().st_mtime_ns
+    source.write_text("# header\nvalue = 2\n")
+    os.utime(source, ns=(old + 10**9, old + 10**9))
+    status, headers, body = get(server, "article.md", etag)
+    assert status == 200
+    assert body == b"# Title\nvalue = 2\n"
+    assert headers["ETag"] != etag
+    assert len(renders) == 2
+
+
+def test_index_and_errors(serving, tmp_path):
+    server, source, renders = serving
+    status, _, body = get(server, "")
+    assert status == 200
+    assert b'href="article.md"' in body
+    assert get(server, "missing.md")[0] == 404
+
+    source.unlink()
+    status, _, body = get(server, "article.md")
+    assert status == 500
+    assert b"Failed to render" in body
@@ -1,6 +1,10 @@
 from pathlib import Path
 
+import markplates
+from markplates.__main__ import find_all_in_source
 from markplates.__main__ import find_in_source
+from markplates.__main__ import SourceCache
+from markplates.__main__ import TemplateState
 
 
 def test_find_source():
@@ -18,3 +22,258 @@ def test_find_source():
     # code = find_in_source(p, "my_squares")
     # assert "twice as much" in code
     # assert code.count("\n") == 4
+
+
+def test_source_cache():
+    p = Path(__file__).resolve().parent / "data/source.py"
+    cache = SourceCache()
+
+    find_in_source(p, "area", cache)
+    find_in_source(p, "Square.area", cache)
+    find_in_source(str(p), "Square", cache)
+    assert cache.misses == 1
+    assert cache.hits == 2
+
+    found = find_all_in_source(p, ["Square.area", "missing", "area"], cache)
+    assert found == [
+        find_in_source(p, "Square.area"),
+        "",
+        find_in_source(p, "area"),
+    ]
+    assert cache.misses == 1
+    assert cache.hits == 3
+
+
+def test_source_cache_shared_by_template(tmp_path):
+    p = Path(__file__).resolve().parent / "data/source.py"
+    template = tmp_path / "t_import.mdt"
+    template.write_text(
+        '{{ set_path("%s") }}{{ import_function("%s", "area") }}'
+        '{{ import_function("%s", "Square.area") }}'
+        % (p.parent, p.name, p.name)
+    )
+    cache = SourceCache()
+    markplates.process_template(template, False, cache, prefetch=False)
+    assert cache.misses == 1
+    assert cache.hits == 1
+
+
+def test_prefetch(tmp_path, monkeypatch):
+    data = Path(__file__).resolve().parent / "data"
+    other = tmp_path / "other.py"
+    other.write_text("# header\nx = 1\n")
+    template = tmp_path / "t_prefetch.mdt"
+    template.write_text(
+        '{{ set_path("%s") }}{{ import_function("source.py", "area") }}\n'
+        '{{ set_path("%s") }}{{ import_source("other.py") }}\n'
+        '&&&& set path = "%s" &&&&'
+        '{{ set_path(path) }}{{ import_source("source.py", [2]) }}\n'
+        % (data, tmp_path, data)
+    )
+    loaded = []
+    original = SourceCache.preload
+
+    def preload(self, source, parse=False):
+        loaded.append((Path(source), parse))
+        return original(self, source, parse)
+
+    monkeypatch.setattr(SourceCache, "preload", preload)
+    cache = SourceCache()
+    text = markplates.process_template(template, False, cache)
+    assert text == markplates.process_template(template, False, prefetch=False)
+    assert sorted(loaded) == sorted(
+        [(data / "source.py", True), (tmp_path / "other.py", False)]
+    )
+    # each file was only loaded once, by whichever thread got to it first,
+    # and the one after the unknown set_path by the render itself
+    assert cache.misses == 3
+
+
+def test_prefetch_import_functions(tmp_path):
+    (tmp_path / "other.py").write_text("x = 1\n")
+    state = TemplateState()
+    executor = state.prefetch_sources(
+        [
+            ("set_path", [str(tmp_path)], {}),
+            ("import_functions", ["other.py", ["x"]], {"language": "python"}),
+        ]
+    )
+    executor.shutdown(wait=True)
+    assert state.source_cache.is_loaded(tmp_path / "other.py", parse=True)
+
+
+def test_source_cache_invalidated(tmp_path):
+    source = tmp_path / "changing.py"
+    source.write_text("def first():\n    pass\n")
+    cache = SourceCache()
+    assert "first" in find_in_source(source, "first", cache)
+
+    source.write_text("def second():\n    return 1\n")
+    assert "second" in find_in_source(source, "second", cache)
+    assert cache.misses == 2
+
+
+def test_symbol_index(tmp_path):
+    source = tmp_path / "nested.py"
+    source.write_text(
+        "LIMIT = 10\n"
+        "\n"
+        "def outer():\n"
+        "    def inner():\n"
+        "        return 1\n"
+        "    return inner\n"
+        "\n"
+        "class Shape:\n"
+        "    sides = 0\n"
+        "\n"
+        "    def area(self):\n"
+        "        return 0\n"
+        "\n"
+        "def outer():\n"
+        "    def other():\n"
+        "        pass\n"
+    )
+    parsed = SourceCache().parse(source)
+    assert set(parsed.symbols) == {
+        "LIMIT",
+        "outer",
+        "outer.inner",
+        "Shape",
+        "Shape.sides",
+        "Shape.area",
+    }
+    assert parsed.get_text("LIMIT") == "LIMIT = 10\n"
+    assert parsed.get_text("outer.inner").lstrip().startswith("def inner():")
+    assert parsed.get_text("Shape.area").lstrip().startswith("def area(self):")
+    # only the first definition of a name is used
+    assert parsed.get_text("outer").endswith("return inner\n")
+    assert parsed.get_text("outer.other") == ""
+
+
+TRICKY_SOURCE = '''\
+import functools
+
+
+@functools.lru_cache()
+def decorated(a):
+    return a
+
+
+def one_liner(): return 1; 
+
+
+def header(a,
+           b): return a + b
+
+
+class Ünïcode:
+    """ Docstring with ünïcode """
+    naïve = "ü"; other = 2
+
+    def méthod(self):
+        if self:
+            return 1
+        else:
+            return 2;  # trailing semicolon
+
+
+(a, b) = 1, 2
+x.y = 3
+pair = [
+    1,
+    2,
+]
+
+
+def continued(): \\
+    return 1
+
+
+def commented():
+    # a comment ending in a backslash \\
+    return 1
+'''
+
+
+def test_spans_match_asttokens(tmp_path):
+    import ast
+    import asttokens
+    from markplates.__main__ import ParsedSource
+
+    def index(atok, parent, prefix, found):
+        for node in ast.iter_child_nodes(parent):
+            if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+                found.setdefault(prefix + node.name, atok.get_text_range(node))
+                index(atok, node, prefix + node.name + ".", found)
+            elif isinstance(node, ast.Assign):
+                name = prefix + node.first_token.string
+                found.setdefault(name, atok.get_text_range(node))
+        return found
+
+    atok = asttokens.ASTTokens(TRICKY_SOURCE, parse=True)
+    expected = index(atok, atok.tree, "", {})
+    parsed = ParsedSource(TRICKY_SOURCE, ast.parse(TRICKY_SOURCE))
+    assert parsed.symbols == expected
+    assert "(" in parsed.symbols and "x" in parsed.symbols
+
+    source = tmp_path / "tricky.py"
+    source.write_text(TRICKY_SOURCE, encoding="utf-8")
+    code = find_in_source(source, "Ünïcode.méthod")
+    assert code.startswith("    def méthod(self):\n")
+    assert code.endswith("return 2\n")
+
+
+QUICK_SOURCE = TRICKY_SOURCE + '''
+
+text = """
+def hidden():
+    pass
+"""
+
+
+async def later(): pass
+def later(): return "sync"
+first = 1
+def first(): return 2
+
+
+class Outer:
+    value = (
+        1)
+
+    class Inner:
+        @staticmethod
+        def deep(s="def deep(): pass", t=\'\'\'
+class Inner: pass\'\'\'):
+            return s  # end
+
+    # a comment
+after = 1
+'''
+
+
+def test_fast_find(tmp_path):
+    import ast
+    from markplates.__main__ import ParsedSource
+
+    source = tmp_path / "quick.py"
+    source.write_text(QUICK_SOURCE, encoding="utf-8")
+    names = list(ParsedSource(QUICK_SOURCE, ast.parse(QUICK_SOURCE)).symbols)
+    names += ["hidden", "missing", "Outer.missing", "Ünïcode.naïve"]
+    for name in names:
+        fast = find_in_source(source, name, SourceCache(), fast=True)
+        assert fast == find_in_source(source, name), name
+
+    cache = SourceCache()
+    code = find_in_source(source, "decorated", cache, fast=True)
+    assert code.startswith("@functools.lru_cache()\n")
+    # found without parsing, or even reading, the whole file
+    assert not cache.is_loaded(source, parse=True)
+    assert cache.bytes_read < len(QUICK_SOURCE) / 4
+    find_in_source(source, "decorated", cache, fast=True)
+    assert cache.hits == 1
+
+    code = find_in_source(source, "Outer.Inner.deep", cache, fast=True)
+    assert code.startswith("        @staticmethod\n")
+    assert code.endswith("return s\n")
+    assert not cache.is_loaded(source, parse=True)
@@ -0,0 +1,72 @@
+""" Heavy dependencies should only be imported when something needs them. """
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+HEAVY = ["asttokens", "click", "code", "jinja2", "pyperclip"]
+
+
+def imported_after(script):
+    """ Run script in a fresh interpreter and report which of the heavy
+    modules it ended up importing.
+    """
+    check = (
+        "import sys, json\n"
+        + script
+        + "\nprint(json.dumps([m for m in %r if m in sys.modules]))" % HEAVY
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", check],
+        cwd=Path(__file__).resolve().parent.parent,
+        stdout=subprocess.PIPE,
+        check=True,
+    )
+    return json.loads(result.stdout.decode().splitlines()[-1])
+
+
+def test_import_is_light():
+    assert imported_after("import markplates") == []
+
+
+def test_cli_module_needs_only_click():
+    assert imported_after("import markplates.__main__") == ["click"]
+
+
+def test_import_source_skips_parsers(tmp_path):
+    template = tmp_path / "t_import.mdt"
+    template.write_text('{{ import_source("%s") }}' % __file__)
+    script = (
+        "import markplates, pathlib\n"
+        "markplates.process_template(pathlib.Path(%r), False)" % str(template)
+    )
+    assert imported_after(script) == ["click", "jinja2"]
+
+
+def test_import_function_without_asttokens(tmp_path):
+    source = Path(__file__).resolve().parent / "data/source.py"
+    template = tmp_path / "t_import.mdt"
+    template.write_text(
+        '{{ import_function("%s", "area") }}' % source.as_posix()
+    )
+    script = (
+        "import markplates, pathlib\n"
+        "markplates.process_template(pathlib.Path(%r), False)" % str(template)
+    )
+    # the positions in the tree are enough for an ordinary source file
+    assert imported_after(script) == ["click", "jinja2"]
+
+
+def test_cli_without_repl(tmp_path):
+    template = tmp_path / "t_plain.mdt"
+    template.write_text("# Title\n{{ 1 + 1 }}\n")
+    script = (
+        "import markplates\n"
+        "sys.argv = ['markplates', %r]\n"
+        "try:\n"
+        "    markplates.main()\n"
+        "except SystemExit:\n"
+        "    pass" % str(template)
+    )
+    # the REPL machinery is only loaded for templates that use it
+    assert imported_after(script) == ["click", "jinja2"]
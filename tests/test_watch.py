@@ -0,0 +1,109 @@
+import io
+import pytest
+from markplates import watch
+
+
+ARTICLE = '{{ set_path("{path}") }}{{ import_source("%s", ["1-$"]) }}'
+
+
+def test_only_affected_templates_rerender(tmp_path, make_article):
+    (tmp_path / "one.py").write_text("one = 1\n")
+    (tmp_path / "two.py").write_text("two = 2\n")
+    first = make_article(ARTICLE % "one.py", "first.mdt")
+    second = make_article(ARTICLE % "two.py", "second.mdt")
+
+    out = io.StringIO()
+    session = watch.WatchSession([first, second], out=out)
+    session.render_all()
+    assert out.getvalue() == "one = 1\ntwo = 2\n"
+    assert session.affected({str((tmp_path / "two.py").resolve())}) == [second]
+    assert session.affected({str(first.resolve())}) == [first]
+    assert session.affected({"/not/used"}) == []
+
+
+def test_errors_keep_session_alive(tmp_path, capsys, make_article):
+    template = make_article(ARTICLE % "missing.py")
+    out_dir = tmp_path / "out"
+    session = watch.WatchSession([template], out_dir)
+    session.render(template)
+    assert "Failed to render" in capsys.readouterr().err
+
+    # the template is still watched so fixing it is noticed
+    assert session.affected({str(template.resolve())}) == [template]
+    (tmp_path / "missing.py").write_text("found = True\n")
+    session.render(template)
+    assert (out_dir / "article.md").read_text() == "found = True\n"
+
+
+def test_polling_watcher(tmp_path, bump):
+    source = tmp_path / "source.py"
+    source.write_text("a = 1\n")
+    watcher = watch.PollingWatcher(interval=0.01)
+    watcher.watch({str(source)})
+    assert watcher.wait(timeout=0.05) == set()
+
+    bump(source, "a = 2\n")
+    assert watcher.wait(timeout=1) == {str(source)}
+
+
+def test_inotify_watcher(tmp_path):
+    try:
+        watcher = watch.InotifyWatcher()
+    except (OSError, AttributeError):
+        pytest.skip("inotify not available")
+    source = tmp_path / "source.py"
+    source.write_text("a = 1\n")
+    other = tmp_path / "other.py"
+    try:
+        watcher.watch({str(source)})
+        other.write_text("not watched\n")
+        assert watcher.wait(timeout=0.1) == set()
+
+        source.write_text("a = 2\n")
+        assert watcher.wait(timeout=1) == {str(source)}
+    finally:
+        watcher.close()
+
+
+def test_inotify_falls_back_to_polling(tmp_path, monkeypatch, bump):
+    try:
+        watcher = watch.InotifyWatcher()
+    except (OSError, AttributeError):
+        pytest.skip("inotify not available")
+    # as when the limit on watches has been reached
+    monkeypatch.setattr(watch.InotifyWatcher, "_add_watch", lambda *_: -1)
+    watcher._polling.interval = 0.01
+    source = tmp_path / "source.py"
+    source.write_text("a = 1\n")
+    try:
+        watcher.watch({str(source)})
+        assert watcher.wait(timeout=0.05) == set()
+
+        bump(source, "a = 2\n")
+        assert watcher.wait(timeout=1) == {str(source)}
+    finally:
+        watcher.close()
+
+
+def test_output_file(tmp_path, monkeypatch, make_article):
+    import click.testing
+    import markplates
+
+    (tmp_path / "one.py").write_text("one = 1\n")
+    template = make_article(ARTICLE % "one.py")
+
+    class Stop:
+        def watch(self, files):
+            raise KeyboardInterrupt
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(watch, "make_watcher", Stop)
+    output = tmp_path / "out2.md"
+    runner = click.testing.CliRunner()
+    result = runner.invoke(
+        markplates.main, ["-w", "-o", str(output), str(template)]
+    )
+    assert result.exit_code == 0
+    assert output.read_text() == "one = 1\n"